@@ -1,14 +1,21 @@
 from django.contrib import admin
+from django.utils.translation import ugettext_lazy as _
 
-from rssfeed.models import Feed, Entry
+from rssfeed.models import Feed, Entry, make_link_hash
+from rssfeed.search import search_entries
 
 
 class FeedAdmin(admin.ModelAdmin):
     list_display = ["url", "title", "published", "last_polled",
-                    "image", "description", ]
+                    "next_poll_at", "last_success", "consecutive_failures",
+                    "disabled", "image", "description", ]
+    list_filter = ["disabled"]
     search_fields = ["link", "title"]
     readonly_fields = ["title", "link", "description", "published",
-                       "last_polled", "image", ]
+                       "last_polled", "next_poll_at", "poll_interval",
+                       "last_success", "consecutive_failures", "last_error",
+                       "image", ]
+    actions = ["enable_feeds"]
     fieldsets = (
         (None, {
             "fields": (
@@ -16,11 +23,21 @@ class FeedAdmin(admin.ModelAdmin):
                 ("title", "link",),
                 ("description",),
                 ("published", "last_polled",),
+                ("next_poll_at", "poll_interval",),
+                ("disabled", "last_success", "consecutive_failures",),
+                ("last_error",),
                 ("image",),
             )
         }),
     )
 
+    def enable_feeds(self, request, queryset):
+        # Poll the feeds again as soon as possible, with a clean record
+        queryset.update(
+            disabled=False, consecutive_failures=0, next_poll_at=None
+        )
+    enable_feeds.short_description = _("Enable and poll selected feeds")
+
 
 admin.site.register(Feed, FeedAdmin)
 
@@ -43,5 +60,15 @@ class EntryAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index rather than icontains over search_fields,
+        # and the link hash index for a link
+        if not search_term.strip():
+            return queryset, False
+        return (
+            queryset.filter(link_hash=make_link_hash(search_term)) |
+            search_entries(queryset, search_term)
+        ), False
+
 
 admin.site.register(Entry, EntryAdmin)
@@ -0,0 +1,60 @@
+import time
+
+from django.core.cache import cache
+
+from rssfeed.conf import get_setting
+
+ENTRIES_VERSION_KEY = "rssfeed:entries_version"
+SEEN_ENTRIES_KEY = "rssfeed:seen_entries:%s"
+
+
+def get_entries_version():
+    """
+    Return the version of the stored entries, part of the key of anything
+    cached from them.
+    """
+    version = cache.get(ENTRIES_VERSION_KEY)
+    if version is None:
+        # Start from the clock so a version lost from the cache is not
+        # reused with stale values still cached under it.
+        version = int(time.time())
+        cache.add(ENTRIES_VERSION_KEY, version, None)
+        version = cache.get(ENTRIES_VERSION_KEY, version)
+    return version
+
+
+def bump_entries_version():
+    """
+    Invalidate everything cached from the stored entries.
+    """
+    try:
+        return cache.incr(ENTRIES_VERSION_KEY)
+    except ValueError:
+        return get_entries_version()
+
+
+def get_seen_entries(db_feed_id):
+    """
+    Return the identities of the entries a feed listed recently.
+    """
+    if not get_setting("SEEN_ENTRIES_SIZE"):
+        return set()
+    return set(cache.get(SEEN_ENTRIES_KEY % db_feed_id) or ())
+
+
+def add_seen_entries(db_feed_id, identities):
+    """
+    Remember the identities of entries a feed listed, keeping the
+    RSSFEED_SEEN_ENTRIES_SIZE most recent.
+    """
+    size = get_setting("SEEN_ENTRIES_SIZE")
+    if not size:
+        return
+    key = SEEN_ENTRIES_KEY % db_feed_id
+    identities = set(identities)
+    seen = [
+        identity for identity in cache.get(key) or ()
+        if identity not in identities
+    ]
+    seen.extend(sorted(identities))
+    cache.set(key, seen[-size:], get_setting("SEEN_ENTRIES_TIMEOUT"))
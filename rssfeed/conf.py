@@ -0,0 +1,82 @@
+from django.conf import settings
+
+# Defaults for the RSSFEED_* settings, see README.rst
+DEFAULTS = {
+    # Bounds, in seconds, of the adaptive interval between polls of a feed
+    "MIN_POLL_INTERVAL": 5 * 60,
+    "MAX_POLL_INTERVAL": 24 * 60 * 60,
+    "DEFAULT_POLL_INTERVAL": 15 * 60,
+    # Longest delay, in seconds, a failing feed is backed off for, and the
+    # number of failures in a row after which it is disabled. None never
+    # disables feeds.
+    "MAX_FAILURE_BACKOFF": 7 * 24 * 60 * 60,
+    "DISABLE_AFTER_FAILURES": 10,
+    # Due feeds are enqueued in batches of this many, each with a random
+    # delay of up to POLL_JITTER seconds
+    "POLL_BATCH_SIZE": 50,
+    "POLL_JITTER": 60,
+    # Seconds before a dispatched feed is considered due again if its poll
+    # never ran
+    "POLL_LEASE": 15 * 60,
+    # Threads fetching feeds concurrently in each worker process, requests
+    # allowed in flight to a single host, requests started per second on a
+    # single host and the socket timeout in seconds
+    "FETCH_WORKERS": 10,
+    "FETCH_PER_HOST": 2,
+    "FETCH_PER_HOST_RATE": 2,
+    "FETCH_TIMEOUT": 30,
+    # Largest feed document read, in bytes
+    "FETCH_MAX_BYTES": 2 * 1024 * 1024,
+    # Processes parsing fetched feeds for poll_feed_batch, 0 parses in the
+    # worker process itself
+    "PARSE_PROCESSES": 0,
+    # Seconds render_rssfeed_cached keeps its output, new entries invalidate
+    # it sooner, and render_rssfeed_fragments keeps the fragment of an entry
+    "RENDER_CACHE_TIMEOUT": 60 * 60,
+    # Part of the key of cached entry fragments, change it to invalidate them
+    # after changing the entry template
+    "RENDER_VERSION": 1,
+    # Dotted path of the metrics backend polling reports to, and the keyword
+    # arguments it is constructed with
+    "METRICS_BACKEND": "rssfeed.metrics.MetricsBackend",
+    "METRICS_OPTIONS": {},
+    # Dotted path of the function converting entry descriptions from HTML to
+    # text, and the longest description kept
+    "TEXT_BACKEND": "rssfeed.text.html_to_text",
+    "DESCRIPTION_MAX_LENGTH": 2000,
+    # Entries per page of the JSON API by default, and at most
+    "API_PAGE_SIZE": 20,
+    "API_MAX_PAGE_SIZE": 100,
+    # Title of the aggregated RSS and Atom feeds of all entries, and the
+    # number of entries in them
+    "SYNDICATION_TITLE": "Latest entries",
+    "SYNDICATION_ITEMS": 50,
+    # Entries older than this many seconds, and those beyond the newest this
+    # many of a feed, are deleted. None keeps them.
+    "ENTRY_MAX_AGE": None,
+    "ENTRY_MAX_PER_FEED": None,
+    # Entries deleted per statement while pruning
+    "PRUNE_BATCH_SIZE": 1000,
+    # Query parameters dropped from entry links before they are compared,
+    # as case insensitive shell patterns
+    "TRACKING_PARAMS": [
+        "utm_*", "at_*", "ns_*", "fbclid", "gclid", "mc_cid", "mc_eid",
+        "ocid", "cmpid",
+    ],
+    # Whether an entry is skipped when another feed already has its link
+    "DEDUPE_ACROSS_FEEDS": True,
+    # Identities of the entries a feed listed recently kept in the cache, so
+    # they are skipped without a query, and for how many seconds
+    "SEEN_ENTRIES_SIZE": 200,
+    "SEEN_ENTRIES_TIMEOUT": 7 * 24 * 60 * 60,
+    # Name of the photologue PhotoSize local thumbnails of entry images are
+    # made with, created with THUMBNAIL_WIDTH and THUMBNAIL_HEIGHT if
+    # missing. None hotlinks the images.
+    "THUMBNAIL_SIZE": None,
+    "THUMBNAIL_WIDTH": 320,
+    "THUMBNAIL_HEIGHT": 180,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "RSSFEED_%s" % name, DEFAULTS[name])
@@ -0,0 +1,112 @@
+import hashlib
+
+from django.contrib.syndication.views import Feed as SyndicationFeed
+from django.core.urlresolvers import reverse
+from django.shortcuts import get_object_or_404
+from django.utils.feedgenerator import Atom1Feed
+from django.views.decorators.http import condition
+
+from rssfeed.caching import get_entries_version
+from rssfeed.conf import get_setting
+from rssfeed.models import Entry, Feed
+
+
+def get_latest_published(request, feed_id=None):
+    """
+    Return the published date of the newest entry, of one feed or of all,
+    or None. It is looked up once per request, through the published index.
+    """
+    if not hasattr(request, "_rssfeed_latest_published"):
+        entries = Entry.objects.order_by("-published")
+        if feed_id is not None:
+            entries = entries.filter(feed_id=feed_id)
+        request._rssfeed_latest_published = entries.values_list(
+            "published", flat=True
+        ).first()
+    return request._rssfeed_latest_published
+
+
+def get_etag(request, feed_id=None):
+    """
+    Return the ETag of a feed of entries, which changes whenever entries
+    are stored as well as with the newest published date. There is no
+    Last-Modified date: entries stored with an older published date would
+    not move it, and readers sending only If-Modified-Since would miss them.
+    """
+    latest = get_latest_published(request, feed_id)
+    if latest is None:
+        return None
+    value = "%s|%s|%s" % (
+        request.path, get_entries_version(), latest.isoformat()
+    )
+    return hashlib.md5(value.encode("utf-8")).hexdigest()
+
+
+class EntriesFeed(SyndicationFeed):
+    """
+    RSS feed of the newest entries, of all feeds or of the feed whose id is
+    in the url.
+    """
+
+    def __call__(self, request, *args, **kwargs):
+        response = super(EntriesFeed, self).__call__(request, *args, **kwargs)
+        # Set by the syndication view from the newest published date, see
+        # get_etag
+        del response["Last-Modified"]
+        return response
+
+    def get_object(self, request, feed_id=None):
+        if feed_id is None:
+            return None
+        return get_object_or_404(Feed, pk=feed_id)
+
+    def title(self, obj):
+        if obj is None:
+            return get_setting("SYNDICATION_TITLE")
+        return obj.title or obj.url
+
+    def link(self, obj):
+        if obj is None:
+            return reverse("rssfeed_entries_rss")
+        return obj.link or obj.url
+
+    def description(self, obj):
+        if obj is None:
+            return get_setting("SYNDICATION_TITLE")
+        return obj.description or ""
+
+    def items(self, obj):
+        entries = Entry.objects.order_by("-published", "-id")
+        if obj is not None:
+            entries = entries.filter(feed=obj)
+        return entries.select_related("feed")[
+            :get_setting("SYNDICATION_ITEMS")
+        ]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.description
+
+    def item_link(self, item):
+        return item.link
+
+    def item_pubdate(self, item):
+        return item.published
+
+    def item_author_name(self, item):
+        return item.feed.title
+
+
+class AtomEntriesFeed(EntriesFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+# Readers polling the feeds are answered with a 304 after the one query
+# for the newest published date.
+entries_rss = condition(etag_func=get_etag)(EntriesFeed())
+entries_atom = condition(etag_func=get_etag)(AtomEntriesFeed())
@@ -0,0 +1,398 @@
+import hashlib
+import re
+import socket
+import threading
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+
+try:
+    from httplib import HTTPConnection, HTTPException, HTTPSConnection
+    from urlparse import urljoin, urlparse
+except ImportError:  # pragma: no cover
+    from http.client import HTTPConnection, HTTPException, HTTPSConnection
+    from urllib.parse import urljoin, urlparse
+
+from rssfeed import __version__
+from rssfeed.conf import get_setting
+
+USER_AGENT = "django-rss-feed/%s" % __version__
+CHUNK_SIZE = 16 * 1024
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# The end of an RSS item or Atom entry, and the root element of a document
+ITEM_END = re.compile(br"</(?:[\w.-]+:)?(?:item|entry)\s*>")
+ROOT_START = re.compile(br"<([A-Za-z_][\w.:-]*)")
+
+
+class FetchError(Exception):
+    pass
+
+
+class FetchResult(object):
+    """
+    The outcome of fetching a feed. Fetching never raises, errors are
+    reported through ``error`` so one bad feed does not fail a whole batch.
+    """
+
+    def __init__(self, url, status=None, body=None, headers=None,
+                 error=None, truncated=False):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.error = error
+        self.truncated = truncated
+        # Seconds the fetch took
+        self.elapsed = None
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+    @property
+    def digest(self):
+        if self.body is None:
+            return None
+        if not hasattr(self, "_digest"):
+            self._digest = hashlib.sha1(self.body).hexdigest()
+        return self._digest
+
+    @property
+    def etag(self):
+        return self.headers.get("etag")
+
+    @property
+    def modified(self):
+        return self.headers.get("last-modified")
+
+    @property
+    def response_headers(self):
+        # The headers feedparser needs to parse the body as if it had
+        # fetched it itself, relative links resolve against the final URL.
+        headers = dict(self.headers)
+        headers.setdefault("content-location", self.url)
+        return headers
+
+
+def get_headers(response):
+    headers = dict((k.lower(), v) for k, v in response.getheaders())
+    # The body is decoded before feedparser sees it
+    headers.pop("content-encoding", None)
+    return headers
+
+
+class GzipReader(object):
+    """
+    Decompresses a gzip encoded response as it is read. No read returns
+    more than ``size`` bytes, so the size limits apply to the decoded feed.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size):
+        while True:
+            data = self.decompressor.unconsumed_tail
+            if not data:
+                data = self.response.read(size)
+                if not data:
+                    return self.decompressor.flush()
+            data = self.decompressor.decompress(data, size)
+            if data:
+                return data
+
+
+def get_reader(response):
+    if response.getheader("content-encoding", "").lower() == "gzip":
+        return GzipReader(response)
+    return response
+
+
+class ConnectionPool(object):
+    """
+    Keeps up to ``max_idle`` idle keep-alive connections to each host, so
+    feeds on the same host share connections and TLS sessions.
+    """
+
+    def __init__(self, max_idle=2):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, scheme, netloc, timeout):
+        """
+        Return a connection to the host and whether it was used before.
+        """
+        with self.lock:
+            idle = self.idle.get((scheme, netloc))
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            try:
+                conn.sock.settimeout(timeout)
+            except (AttributeError, socket.error):
+                # Reconnects on the next request
+                conn.close()
+            return conn, True
+        if scheme == "https":
+            return HTTPSConnection(netloc, timeout=timeout), False
+        return HTTPConnection(netloc, timeout=timeout), False
+
+    def put(self, scheme, netloc, conn):
+        with self.lock:
+            idle = self.idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+def get_closing_tags(head):
+    """
+    Return the tags closing the document that starts with ``head``, used to
+    keep a truncated feed well formed.
+    """
+    for match in ROOT_START.finditer(head):
+        root = match.group(1)
+        if root == b"rss":
+            return b"</channel></rss>"
+        return b"</" + root + b">"
+    return b""
+
+
+def read_body(response, max_bytes, max_items=None, deadline=None):
+    """
+    Read a feed document in chunks, stopping after ``max_items`` items or
+    entries have been read. Returns the body and whether it was truncated.
+
+    A document over ``max_bytes`` is cut after its last complete item. The
+    items that were read are closed off so the result still parses cleanly.
+    """
+    chunks = []
+    size = 0
+    items = 0
+    last_item_end = None
+    tail = b""
+    while True:
+        if deadline is not None and time.time() > deadline:
+            raise FetchError("Timed out reading feed")
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            return b"".join(chunks), False
+
+        # Scan the new chunk, with enough of the previous one to find a tag
+        # split between the two.
+        offset = size - len(tail)
+        for match in ITEM_END.finditer(tail + chunk):
+            end = offset + match.end()
+            if last_item_end is not None and end <= last_item_end:
+                continue
+            last_item_end = end
+            items += 1
+            if max_items and items >= max_items:
+                break
+        chunks.append(chunk)
+        size += len(chunk)
+        tail = chunk[-32:]
+
+        if (max_items and items >= max_items) or size > max_bytes:
+            break
+
+    if last_item_end is None:
+        raise FetchError("Feed is larger than %s bytes" % max_bytes)
+    body = b"".join(chunks)
+    return body[:last_item_end] + get_closing_tags(body[:1024]), True
+
+
+def fetch(url, etag=None, modified=None, timeout=None, max_items=None,
+          connections=None):
+    """
+    Fetch a single feed, sending back the validators of the previous fetch.
+
+    At most RSSFEED_FETCH_MAX_BYTES are read, and reading stops after
+    ``max_items`` items. The whole fetch is limited to the timeout.
+    Connections are taken from and returned to the ``connections`` pool
+    when one is given.
+    """
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    if timeout is None:
+        timeout = get_setting("FETCH_TIMEOUT")
+    if connections is None:
+        connections = ConnectionPool(max_idle=0)
+    start = time.time()
+    try:
+        result = fetch_url(
+            url, headers, timeout, max_items, start + timeout, connections
+        )
+    except Exception as e:
+        result = FetchResult(url, error=str(e) or e.__class__.__name__)
+    result.elapsed = time.time() - start
+    return result
+
+
+def request(url, headers, timeout, connections):
+    """
+    Send a GET request, returning the response and the connection it came
+    on. A pooled connection the server has since closed is replaced once.
+    """
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    while True:
+        conn, reused = connections.get(parsed.scheme, parsed.netloc, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            return conn.getresponse(), conn
+        except (HTTPException, socket.error):
+            conn.close()
+            if not reused:
+                raise
+
+
+def release(url, response, conn, connections):
+    # Only a connection whose response was read to the end can take
+    # another request
+    if response.isclosed() and not response.will_close:
+        parsed = urlparse(url)
+        connections.put(parsed.scheme, parsed.netloc, conn)
+    else:
+        conn.close()
+
+
+def fetch_url(url, headers, timeout, max_items, deadline, connections):
+    for i in range(MAX_REDIRECTS + 1):
+        response, conn = request(url, headers, timeout, connections)
+        try:
+            location = response.getheader("location")
+            if response.status in REDIRECT_CODES and location:
+                response.read()
+                release(url, response, conn, connections)
+                url = urljoin(url, location)
+                continue
+            if response.status == 304:
+                response.read()
+                release(url, response, conn, connections)
+                return FetchResult(
+                    url, status=304, headers=get_headers(response)
+                )
+            if response.status >= 400:
+                conn.close()
+                return FetchResult(
+                    url, status=response.status,
+                    error="HTTP %s" % response.status
+                )
+            body, truncated = read_body(
+                get_reader(response), get_setting("FETCH_MAX_BYTES"),
+                max_items, deadline
+            )
+        except Exception:
+            conn.close()
+            raise
+        release(url, response, conn, connections)
+        return FetchResult(
+            url,
+            status=response.status,
+            body=body,
+            headers=get_headers(response),
+            truncated=truncated
+        )
+    return FetchResult(url, error="Too many redirects")
+
+
+class Fetcher(object):
+    """
+    Fetches batches of feeds concurrently on a bounded pool of threads,
+    allowing at most ``per_host`` requests in flight to any one host and
+    starting at most ``per_host_rate`` requests a second on it. Keep-alive
+    connections are shared between the requests to a host.
+    """
+
+    def __init__(self, workers=None, per_host=None, timeout=None,
+                 per_host_rate=None):
+        self.workers = workers or get_setting("FETCH_WORKERS")
+        self.per_host = per_host or get_setting("FETCH_PER_HOST")
+        self.per_host_rate = (
+            per_host_rate or get_setting("FETCH_PER_HOST_RATE")
+        )
+        self.timeout = timeout
+        self.pool = None
+        self.connections = ConnectionPool(max_idle=self.per_host)
+        self.host_semaphores = {}
+        self.host_next_start = {}
+        self.lock = threading.Lock()
+
+    def get_semaphore(self, host):
+        with self.lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host
+                )
+            return self.host_semaphores[host]
+
+    def wait_for_turn(self, host):
+        """
+        Sleep until the next request to the host may start.
+        """
+        if not self.per_host_rate:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(now, self.host_next_start.get(host, now))
+            self.host_next_start[host] = start + 1.0 / self.per_host_rate
+        if start > now:
+            time.sleep(start - now)
+
+    def fetch(self, url, etag=None, modified=None, max_items=None):
+        host = urlparse(url).netloc.lower()
+        with self.get_semaphore(host):
+            self.wait_for_turn(host)
+            return fetch(
+                url, etag, modified, self.timeout, max_items,
+                self.connections
+            )
+
+    def fetch_many(self, requests, max_items=None):
+        """
+        Fetch a list of (url, etag, modified) tuples, returning the results
+        in the same order.
+        """
+        if self.pool is None:
+            self.pool = ThreadPool(self.workers)
+        return self.pool.map(
+            lambda request: self.fetch(*request, max_items=max_items),
+            requests
+        )
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.connections.close()
+
+
+_fetcher = None
+
+
+def get_fetcher():
+    # Created on first use so the threads are started in the worker process
+    # rather than inherited across a fork.
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher()
+    return _fetcher
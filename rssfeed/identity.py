@@ -0,0 +1,74 @@
+"""
+Identity of entries, so the same item is stored once even when its link
+carries tracking parameters, changes scheme or is syndicated by other feeds.
+"""
+import fnmatch
+
+try:
+    from urlparse import urlsplit, urlunsplit
+except ImportError:  # pragma: no cover
+    from urllib.parse import urlsplit, urlunsplit
+
+from django.utils import six
+
+from rssfeed.conf import get_setting
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def is_tracking_param(name, patterns):
+    name = name.lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def canonicalize_url(url):
+    """
+    Return the canonical form of a url: https, a lowercase host without
+    its default port, no fragment and no RSSFEED_TRACKING_PARAMS. Anything
+    that is not an http or https url is only stripped.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip(".")
+    if port is not None and str(port) != DEFAULT_PORTS[scheme]:
+        host = "%s:%s" % (host, port)
+    if "@" in parts.netloc:
+        host = "%s@%s" % (parts.netloc.rsplit("@", 1)[0], host)
+
+    # Filter the raw parameters rather than parse and encode them again, so
+    # the encoding of those kept is left as it is
+    patterns = [
+        pattern.lower() for pattern in get_setting("TRACKING_PARAMS")
+    ]
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not is_tracking_param(param.split("=", 1)[0], patterns)
+    )
+    return urlunsplit(("https", host, parts.path or "/", query, ""))
+
+
+def get_guid(entry):
+    """
+    Return the guid or Atom id of a parsed entry, or None.
+    """
+    guid = getattr(entry, "id", None)
+    if not isinstance(guid, six.string_types):
+        return None
+    return guid.strip() or None
+
+
+def get_identities(attrs):
+    """
+    Return the hashes identifying the parsed attributes of an entry.
+    """
+    return {attrs["link_hash"]} | (
+        {attrs["guid_hash"]} if attrs.get("guid_hash") else set()
+    )
@@ -0,0 +1,86 @@
+import re
+
+try:
+    from urlparse import urlparse
+except ImportError:  # pragma: no cover
+    from urllib.parse import urlparse
+
+# Entry.image max_length
+MAX_LENGTH = 2000
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+IMAGE_SCHEMES = ("http", "https", "")
+
+# src attribute of an <img> tag, double, single or unquoted. Each branch
+# stops at characters that cannot occur in it.
+IMG_SRC = re.compile(
+    r"""<img\b[^>]*?\ssrc\s*=\s*(?:"([^"<>]*)"|'([^'<>]*)'|([^\s"'<>]+))""",
+    re.IGNORECASE
+)
+
+
+def is_image_url(url, mime=None):
+    """
+    Return whether the url is an absolute web url to an image, judged by
+    its MIME type when one is given, otherwise by the extension of its path.
+    """
+    if not url or len(url) > MAX_LENGTH:
+        return False
+    parsed = urlparse(url)
+    if parsed.scheme not in IMAGE_SCHEMES or not parsed.netloc:
+        return False
+    if mime:
+        return mime.lower().startswith("image/")
+    return parsed.path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def find_enclosure_image(enclosures):
+    """
+    Return the url of the first image enclosure, or "".
+    """
+    for enclosure in enclosures or []:
+        url = enclosure.get("href") or enclosure.get("url")
+        if is_image_url(url, enclosure.get("type")):
+            return url
+    return ""
+
+
+def find_summary_image(summary):
+    """
+    Return the first <img> src in the summary HTML that points to an image,
+    or "".
+    """
+    if not summary:
+        return ""
+    # str.find skips to each tag faster than the pattern could. Each match
+    # stops at the end of its tag, or at the next tag when it is not closed,
+    # so no part of the summary is scanned twice.
+    lowered = summary.lower()
+    start = lowered.find("<img")
+    end = -1
+    while start != -1:
+        if end < start:
+            end = lowered.find(">", start)
+            if end == -1:
+                break
+        following = lowered.find("<img", start + 4, end)
+        match = IMG_SRC.match(
+            summary, start, end if following == -1 else following
+        )
+        if match:
+            url = (match.group(1) or match.group(2) or match.group(3)).strip()
+            url = url.replace("&amp;", "&")
+            if is_image_url(url):
+                return url
+        start = lowered.find("<img", end) if following == -1 else following
+    return ""
+
+
+def get_entry_image(entry):
+    """
+    Return the image of an entry without media tags, from its enclosures or
+    else from the summary.
+    """
+    return (
+        find_enclosure_image(getattr(entry, "enclosures", None)) or
+        find_summary_image(getattr(entry, "summary", None))
+    )
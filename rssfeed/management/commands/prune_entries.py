@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from rssfeed.retention import prune_entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete old entries in batches. Defaults to the RSSFEED_ENTRY_MAX_AGE "
+        "and RSSFEED_ENTRY_MAX_PER_FEED settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age", type=int,
+            help="Delete entries published more than this many seconds ago"
+        )
+        parser.add_argument(
+            "--max-per-feed", type=int,
+            help="Delete the entries beyond the newest this many of each feed"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, help="Entries deleted per statement"
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune_entries(
+            options["max_age"], options["max_per_feed"],
+            options["batch_size"]
+        )
+        self.stdout.write("Deleted %d entries" % deleted)
@@ -0,0 +1,247 @@
+"""
+Instrumentation for feed polling.
+
+Polling reports timers and counters to the backend named by the
+RSSFEED_METRICS_BACKEND setting, constructed with RSSFEED_METRICS_OPTIONS as
+keyword arguments. The default backend discards everything.
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.signals import setting_changed
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+
+from rssfeed.conf import get_setting
+
+
+class MetricsBackend(object):
+    """
+    Interface of metrics backends, which does nothing. Timings are in
+    seconds and tags are a dict of label names to values.
+    """
+    enabled = False
+
+    def incr(self, name, value=1, tags=None):
+        pass
+
+    def timing(self, name, seconds, tags=None):
+        pass
+
+    def flush(self):
+        pass
+
+
+class StatsdBackend(MetricsBackend):
+    """
+    Sends metrics to statsd over UDP. Tags are sent in the DogStatsD format
+    when ``tags`` is True, plain statsd servers need it to be False.
+    """
+    enabled = True
+
+    def __init__(self, host="localhost", port=8125, prefix="rssfeed",
+                 tags=False):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.send_tags = tags
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, kind, tags):
+        line = "%s.%s:%s|%s" % (self.prefix, name, value, kind)
+        if self.send_tags and tags:
+            line += "|#" + ",".join(
+                "%s:%s" % (key, tags[key]) for key in sorted(tags)
+            )
+        try:
+            self.socket.sendto(line.encode("utf-8"), self.address)
+        except socket.error:
+            pass
+
+    def incr(self, name, value=1, tags=None):
+        self.send(name, value, "c", tags)
+
+    def timing(self, name, seconds, tags=None):
+        self.send(name, int(round(seconds * 1000)), "ms", tags)
+
+
+class PrometheusBackend(MetricsBackend):
+    """
+    Keeps counters and timing summaries in memory and renders them in the
+    Prometheus text exposition format. With ``textfile`` set, flush writes
+    them for the node exporter's textfile collector, which suits short
+    lived worker processes. Every process has counters of its own, so each
+    writes a file of its own next to ``textfile``, named after its pid, and
+    labels its metrics with a ``pid`` label.
+    """
+    enabled = True
+
+    def __init__(self, prefix="rssfeed", textfile=None):
+        self.prefix = prefix
+        self.textfile = textfile
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.summaries = {}
+
+    def get_key(self, name, tags):
+        return (name, tuple(sorted((tags or {}).items())))
+
+    def incr(self, name, value=1, tags=None):
+        key = self.get_key(name, tags)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timing(self, name, seconds, tags=None):
+        key = self.get_key(name, tags)
+        with self.lock:
+            count, total = self.summaries.get(key, (0, 0.0))
+            self.summaries[key] = (count + 1, total + seconds)
+
+    def format_labels(self, labels):
+        if not labels:
+            return ""
+        return "{%s}" % ",".join(
+            '%s="%s"' % (
+                key, str(value).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for key, value in labels
+        )
+
+    def render(self, labels=()):
+        """
+        Render the metrics, with ``labels`` added to the labels of each.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(
+                ((name, labels + tags), value)
+                for (name, tags), value in self.counters.items()
+            )
+            summaries = sorted(
+                ((name, labels + tags), value)
+                for (name, tags), value in self.summaries.items()
+            )
+        names = set()
+        for (name, labels), value in counters:
+            metric = "%s_%s_total" % (self.prefix, name)
+            if metric not in names:
+                names.add(metric)
+                lines.append("# TYPE %s counter" % metric)
+            lines.append("%s%s %s" % (
+                metric, self.format_labels(labels), value))
+        for (name, labels), (count, total) in summaries:
+            metric = "%s_%s_seconds" % (self.prefix, name)
+            if metric not in names:
+                names.add(metric)
+                lines.append("# TYPE %s summary" % metric)
+            lines.append("%s_count%s %s" % (
+                metric, self.format_labels(labels), count))
+            lines.append("%s_sum%s %r" % (
+                metric, self.format_labels(labels), total))
+        return "\n".join(lines) + "\n"
+
+    def get_textfile(self, pid):
+        root, ext = os.path.splitext(self.textfile)
+        return "%s.%s%s" % (root, pid, ext)
+
+    def flush(self):
+        if not self.textfile:
+            return
+        pid = os.getpid()
+        # Write then rename, so the collector never reads a partial file
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(self.textfile))
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render((("pid", pid),)))
+        os.rename(path, self.get_textfile(pid))
+
+
+class RecordingBackend(MetricsBackend):
+    """
+    Records metrics, so a process on the parse pool can return them to be
+    reported by the process that handed it the work.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.records = []
+
+    def incr(self, name, value=1, tags=None):
+        self.records.append(("incr", name, value, tags))
+
+    def timing(self, name, seconds, tags=None):
+        self.records.append(("timing", name, seconds, tags))
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_class = import_string(get_setting("METRICS_BACKEND"))
+        _backend = backend_class(**get_setting("METRICS_OPTIONS"))
+    return _backend
+
+
+def reset_backend(**kwargs):
+    global _backend
+    if kwargs.get("setting", "").startswith("RSSFEED_METRICS"):
+        _backend = None
+
+
+setting_changed.connect(reset_backend)
+
+
+@contextmanager
+def recording():
+    """
+    Record the metrics reported in the block instead of sending them to the
+    backend, and yield the list they are recorded to for replay.
+    """
+    global _backend
+    backend, _backend = _backend, RecordingBackend()
+    try:
+        yield _backend.records
+    finally:
+        _backend = backend
+
+
+def replay(records):
+    backend = get_backend()
+    for method, name, value, tags in records:
+        getattr(backend, method)(name, value, tags)
+
+
+def incr(name, value=1, **tags):
+    get_backend().incr(name, value, tags)
+
+
+@contextmanager
+def timer(name, **tags):
+    start = time.time()
+    try:
+        yield
+    finally:
+        get_backend().timing(name, time.time() - start, tags)
+
+
+@contextmanager
+def count_queries(name, **tags):
+    """
+    Count the database queries run in the block. This needs Django's debug
+    cursor, so it is only done when a metrics backend is enabled.
+    """
+    if not get_backend().enabled:
+        yield
+        return
+    with CaptureQueriesContext(connection) as queries:
+        yield
+    get_backend().incr(name, len(queries), tags)
+
+
+def flush():
+    get_backend().flush()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0002_feed_validators'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entry',
+            name='published',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
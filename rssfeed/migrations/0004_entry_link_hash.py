@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0003_entry_published_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='link_hash',
+            field=models.CharField(editable=False, max_length=40, null=True),
+        ),
+    ]
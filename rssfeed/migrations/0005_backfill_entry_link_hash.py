@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.db import migrations
+
+
+def backfill_link_hash(apps, schema_editor):
+    """
+    Hash the links of existing entries, dropping duplicate entries within a
+    feed so the unique constraint can be added. The oldest row is kept.
+    """
+    Entry = apps.get_model("rssfeed", "Entry")
+    seen = set()
+    duplicates = []
+    rows = Entry.objects.order_by("id").values_list("id", "feed_id", "link")
+    for pk, feed_id, link in rows.iterator():
+        link_hash = hashlib.sha1(link.strip().encode("utf-8")).hexdigest()
+        if (feed_id, link_hash) in seen:
+            duplicates.append(pk)
+            continue
+        seen.add((feed_id, link_hash))
+        Entry.objects.filter(pk=pk).update(link_hash=link_hash)
+    for i in range(0, len(duplicates), 500):
+        Entry.objects.filter(pk__in=duplicates[i:i + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0004_entry_link_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_link_hash, migrations.RunPython.noop),
+    ]
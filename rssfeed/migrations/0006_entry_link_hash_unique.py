@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0005_backfill_entry_link_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entry',
+            name='link_hash',
+            field=models.CharField(editable=False, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='entry',
+            name='link',
+            field=models.CharField(max_length=2000),
+        ),
+        migrations.AlterUniqueTogether(
+            name='entry',
+            unique_together=set([('feed', 'link_hash')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0007_feed_poll_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='body_digest',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='entries_digest',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
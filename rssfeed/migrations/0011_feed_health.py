@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0010_entry_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='disabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_success',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
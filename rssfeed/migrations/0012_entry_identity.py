@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from rssfeed.search import install_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0011_feed_health'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='guid_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True),
+        ),
+        migrations.AlterField(
+            model_name='entry',
+            name='link_hash',
+            field=models.CharField(db_index=True, editable=False, max_length=40),
+        ),
+        migrations.AlterIndexTogether(
+            name='entry',
+            index_together=set([('published', 'id'), ('feed', 'guid_hash'), ('feed', 'published', 'id')]),
+        ),
+        # SQLite rebuilt the table without the search triggers
+        migrations.RunPython(
+            install_search_index, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import fnmatch
+import hashlib
+
+try:
+    from urlparse import urlsplit, urlunsplit
+except ImportError:  # pragma: no cover
+    from urllib.parse import urlsplit, urlunsplit
+
+from django.db import migrations
+
+# Copies of rssfeed.identity.canonicalize_url and make_link_hash, and of the
+# default RSSFEED_TRACKING_PARAMS, as they were when this migration was
+# written, so it hashes links the same on every install.
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+TRACKING_PARAMS = [
+    "utm_*", "at_*", "ns_*", "fbclid", "gclid", "mc_cid", "mc_eid", "ocid",
+    "cmpid",
+]
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return any(
+        fnmatch.fnmatchcase(name, pattern) for pattern in TRACKING_PARAMS
+    )
+
+
+def canonicalize_url(url):
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip(".")
+    if port is not None and str(port) != DEFAULT_PORTS[scheme]:
+        host = "%s:%s" % (host, port)
+    if "@" in parts.netloc:
+        host = "%s@%s" % (parts.netloc.rsplit("@", 1)[0], host)
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not is_tracking_param(param.split("=", 1)[0])
+    )
+    return urlunsplit(("https", host, parts.path or "/", query, ""))
+
+
+def make_link_hash(link):
+    return hashlib.sha1(canonicalize_url(link).encode("utf-8")).hexdigest()
+
+
+def rehash_links(apps, schema_editor):
+    """
+    Hash the canonical links of existing entries, dropping entries whose
+    canonical link is already stored in their feed. The oldest row is kept.
+    """
+    Entry = apps.get_model("rssfeed", "Entry")
+    seen = set()
+    duplicates = []
+    changed = []
+    rows = Entry.objects.order_by("id").values_list(
+        "id", "feed_id", "link", "link_hash"
+    )
+    for pk, feed_id, link, old_hash in rows.iterator():
+        link_hash = make_link_hash(link)
+        if (feed_id, link_hash) in seen:
+            duplicates.append(pk)
+            continue
+        seen.add((feed_id, link_hash))
+        if link_hash != old_hash:
+            changed.append((pk, link_hash))
+    # Delete first so the new hashes do not collide with duplicates
+    for i in range(0, len(duplicates), 500):
+        Entry.objects.filter(pk__in=duplicates[i:i + 500]).delete()
+    for pk, link_hash in changed:
+        Entry.objects.filter(pk=pk).update(link_hash=link_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0012_entry_identity'),
+    ]
+
+    operations = [
+        migrations.RunPython(rehash_links, migrations.RunPython.noop),
+    ]
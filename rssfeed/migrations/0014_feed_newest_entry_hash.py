@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0013_rehash_entry_links'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='newest_entry_hash',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
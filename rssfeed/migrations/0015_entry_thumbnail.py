@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 13:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from rssfeed.search import install_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rssfeed', '0014_feed_newest_entry_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='thumbnail',
+            field=models.CharField(blank=True, editable=False, max_length=2000, null=True),
+        ),
+        # SQLite rebuilt the table without the search triggers
+        migrations.RunPython(
+            install_search_index, migrations.RunPython.noop
+        ),
+    ]
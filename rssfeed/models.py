@@ -1,6 +1,27 @@
+import hashlib
+
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from rssfeed.identity import canonicalize_url
+
+
+def make_link_hash(link):
+    """
+    Return the fixed width hash of the canonical form of an entry link, used
+    to identify the entry.
+    """
+    return hashlib.sha1(canonicalize_url(link).encode("utf-8")).hexdigest()
+
+
+def make_guid_hash(guid):
+    """
+    Return the fixed width hash used to identify an entry within its feed by
+    its guid. Guids that are urls are compared in their canonical form.
+    """
+    return hashlib.sha1(canonicalize_url(guid).encode("utf-8")).hexdigest()
+
 
 class Feed(models.Model):
     title = models.CharField(max_length=2000, blank=True, null=True)
@@ -15,6 +36,28 @@ class Feed(models.Model):
     published = models.DateTimeField(blank=True, null=True)
     last_polled = models.DateTimeField(blank=True, null=True)
     image = models.ImageField(max_length=2000, null=True)
+    # HTTP validators from the last fetch, sent back on the next poll so an
+    # unchanged feed is answered with a 304.
+    etag = models.CharField(max_length=255, blank=True, null=True)
+    modified = models.CharField(max_length=255, blank=True, null=True)
+    # Digests of the last fetched document and of its entries, for servers
+    # that do not support conditional requests
+    body_digest = models.CharField(max_length=40, blank=True, null=True)
+    entries_digest = models.CharField(max_length=40, blank=True, null=True)
+    # Link hash of the first entry of the last document, parsing of a feed
+    # listing its entries newest first stops there
+    newest_entry_hash = models.CharField(
+        max_length=40, blank=True, null=True
+    )
+    # Seconds between polls, adapted to how often the feed updates
+    poll_interval = models.PositiveIntegerField(blank=True, null=True)
+    next_poll_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    # Health of the feed. Failing feeds are backed off exponentially and
+    # disabled after RSSFEED_DISABLE_AFTER_FAILURES failures in a row.
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    last_success = models.DateTimeField(blank=True, null=True)
+    disabled = models.BooleanField(default=False)
 
     class Meta:
         verbose_name = _("Feed")
@@ -24,12 +67,10 @@ class Feed(models.Model):
         return self.title or self.url
 
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super(Feed, self).save(*args, **kwargs)
         # Poll new Feed
-        try:
-            Feed.objects.get(url=self.url)
-            super(Feed, self).save(*args, **kwargs)
-        except Feed.DoesNotExist:
-            super(Feed, self).save(*args, **kwargs)
+        if is_new:
             from rssfeed.tasks import poll_feed
             poll_feed.delay(self.pk)
 
@@ -37,14 +78,38 @@ class Feed(models.Model):
 class Entry(models.Model):
     feed = models.ForeignKey(Feed)
     title = models.CharField(max_length=2000, blank=True, null=True)
-    link = models.CharField(max_length=2000, db_index=True)
+    link = models.CharField(max_length=2000)
+    # Indexing the full link is expensive, lookups and deduplication go
+    # through this hash of its canonical form instead.
+    link_hash = models.CharField(max_length=40, editable=False, db_index=True)
+    # Hash of the guid or Atom id, which identifies the entry within its
+    # feed even when its link changes
+    guid_hash = models.CharField(
+        max_length=40, blank=True, null=True, editable=False
+    )
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(max_length=2000, null=True)
-    published = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Url of the local thumbnail of the image, empty if it could not be
+    # made and None until it is
+    thumbnail = models.CharField(
+        max_length=2000, blank=True, null=True, editable=False
+    )
+    published = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         ordering = ["-published"]
+        unique_together = (("feed", "link_hash"),)
+        # Keyset pagination of all entries and of the entries of some feeds,
+        # and lookups by guid
+        index_together = (
+            ("published", "id"), ("feed", "published", "id"),
+            ("feed", "guid_hash"),
+        )
         verbose_name_plural = _("entries")
 
     def __unicode__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        self.link_hash = make_link_hash(self.link)
+        super(Entry, self).save(*args, **kwargs)
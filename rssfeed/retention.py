@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from rssfeed.caching import bump_entries_version
+from rssfeed.conf import get_setting
+from rssfeed.models import Entry, Feed
+
+
+def delete_in_batches(entries, batch_size):
+    """
+    Delete the entries of a queryset a batch at a time, oldest first, each
+    batch in its own short transaction. Returns the number deleted.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            entries.order_by("published", "id").values_list(
+                "id", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return deleted
+        Entry.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+def prune_old_entries(max_age, batch_size):
+    """
+    Delete the entries published more than max_age seconds ago.
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    return delete_in_batches(
+        Entry.objects.filter(published__lt=cutoff), batch_size
+    )
+
+
+def prune_feed_entries(db_feed_id, max_per_feed, batch_size):
+    """
+    Delete the entries of a feed beyond its newest max_per_feed.
+    """
+    entries = Entry.objects.filter(feed_id=db_feed_id)
+    # The newest entry to delete, found through the (feed, published, id)
+    # index
+    first = entries.order_by("-published", "-id").values_list(
+        "published", "id"
+    )[max_per_feed:max_per_feed + 1]
+    if not first:
+        return 0
+    published, pk = first[0]
+    return delete_in_batches(
+        entries.filter(published__lte=published).filter(
+            Q(published__lt=published) | Q(id__lte=pk)
+        ),
+        batch_size
+    )
+
+
+def prune_entries(max_age=None, max_per_feed=None, batch_size=None):
+    """
+    Delete the entries older than max_age seconds and those beyond the
+    newest max_per_feed of each feed, defaulting to the
+    RSSFEED_ENTRY_MAX_AGE and RSSFEED_ENTRY_MAX_PER_FEED settings. Returns
+    the number deleted.
+    """
+    if max_age is None:
+        max_age = get_setting("ENTRY_MAX_AGE")
+    if max_per_feed is None:
+        max_per_feed = get_setting("ENTRY_MAX_PER_FEED")
+    if batch_size is None:
+        batch_size = get_setting("PRUNE_BATCH_SIZE")
+
+    deleted = 0
+    if max_age:
+        deleted += prune_old_entries(max_age, batch_size)
+    if max_per_feed:
+        for db_feed_id in Feed.objects.values_list("id", flat=True):
+            deleted += prune_feed_entries(
+                db_feed_id, max_per_feed, batch_size
+            )
+    if deleted:
+        bump_entries_version()
+    return deleted
+
+
+def get_retained(entries):
+    """
+    Return the parsed entries of a feed that pruning would keep, so entries
+    still listed in a feed are not stored again only to be pruned.
+    """
+    max_age = get_setting("ENTRY_MAX_AGE")
+    max_per_feed = get_setting("ENTRY_MAX_PER_FEED")
+    if max_age:
+        # get_entry_attrs gives naive local times
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        entries = [
+            attrs for attrs in entries
+            if "published" not in attrs or
+            get_naive(attrs["published"]) >= cutoff
+        ]
+    if max_per_feed and len(entries) > max_per_feed:
+        entries = sorted(
+            entries, key=lambda attrs: get_naive(attrs.get("published")),
+            reverse=True
+        )[:max_per_feed]
+    return entries
+
+
+def get_naive(value):
+    if value is None:
+        return datetime.now()
+    if timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
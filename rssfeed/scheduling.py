@@ -0,0 +1,147 @@
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from rssfeed.conf import get_setting
+from rssfeed.models import Feed
+
+# Feeds claimed per UPDATE, below the 999 query parameters of SQLite
+CLAIM_CHUNK_SIZE = 500
+# sy:updatePeriod values in seconds
+UPDATE_PERIODS = {
+    "hourly": 60 * 60,
+    "daily": 24 * 60 * 60,
+    "weekly": 7 * 24 * 60 * 60,
+    "monthly": 30 * 24 * 60 * 60,
+    "yearly": 365 * 24 * 60 * 60,
+}
+
+
+def get_hint_interval(parsed):
+    """
+    Return the longest interval in seconds the feed asks to be polled at,
+    from its <ttl> or sy:updatePeriod / sy:updateFrequency, or None.
+    """
+    hints = []
+    try:
+        hints.append(int(parsed.feed.ttl) * 60)
+    except (AttributeError, TypeError, ValueError):
+        pass
+    period = UPDATE_PERIODS.get(getattr(parsed.feed, "sy_updateperiod", None))
+    if period:
+        try:
+            frequency = int(getattr(parsed.feed, "sy_updatefrequency", 1))
+        except (TypeError, ValueError):
+            frequency = 1
+        hints.append(period // max(frequency, 1))
+    return max(hints) if hints else None
+
+
+def clamp_interval(interval, hint=None):
+    minimum = get_setting("MIN_POLL_INTERVAL")
+    maximum = get_setting("MAX_POLL_INTERVAL")
+    if hint:
+        # The hint raises the minimum but never past the maximum
+        minimum = max(minimum, min(hint, maximum))
+    maximum = max(maximum, minimum)
+    return int(min(max(interval, minimum), maximum))
+
+
+def get_next_poll_at(interval):
+    # Spread feeds with the same interval so they do not stay in lockstep
+    return timezone.now() + timedelta(
+        seconds=interval * random.uniform(0.9, 1.1)
+    )
+
+
+def schedule_next_poll(db_feed, updated, hint=None):
+    """
+    Set the interval and next poll time of a feed after a successful poll.
+
+    The interval is halved when the poll found new entries and grows by half
+    when it did not, bounded by the settings and the feed's own hint as
+    returned by get_hint_interval.
+    """
+    interval = db_feed.poll_interval or get_setting("DEFAULT_POLL_INTERVAL")
+    if updated:
+        interval = interval / 2.0
+    else:
+        interval = interval * 1.5
+    db_feed.poll_interval = clamp_interval(interval, hint)
+    db_feed.next_poll_at = get_next_poll_at(db_feed.poll_interval)
+    return db_feed
+
+
+def schedule_failure(db_feed, error=None):
+    """
+    Record a failed poll and back the feed off exponentially, from its poll
+    interval up to RSSFEED_MAX_FAILURE_BACKOFF. The feed is disabled after
+    RSSFEED_DISABLE_AFTER_FAILURES failures in a row.
+    """
+    db_feed.consecutive_failures += 1
+    db_feed.last_error = (
+        force_text(error, errors="replace") if error is not None else None
+    )
+    interval = db_feed.poll_interval or get_setting("DEFAULT_POLL_INTERVAL")
+    backoff = min(
+        interval * 2 ** min(db_feed.consecutive_failures, 32),
+        get_setting("MAX_FAILURE_BACKOFF")
+    )
+    db_feed.next_poll_at = get_next_poll_at(backoff)
+    threshold = get_setting("DISABLE_AFTER_FAILURES")
+    if threshold and db_feed.consecutive_failures >= threshold:
+        db_feed.disabled = True
+    Feed.objects.filter(pk=db_feed.pk).update(
+        consecutive_failures=db_feed.consecutive_failures,
+        last_error=db_feed.last_error,
+        next_poll_at=db_feed.next_poll_at,
+        disabled=db_feed.disabled
+    )
+    return db_feed
+
+
+def get_success_attrs():
+    """
+    Return the attributes recording a successful poll of a feed.
+    """
+    return {
+        "consecutive_failures": 0,
+        "last_error": None,
+        "last_success": timezone.now(),
+    }
+
+
+def get_due_feeds(now=None):
+    now = now or timezone.now()
+    return Feed.objects.filter(
+        Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now),
+        disabled=False
+    )
+
+
+def claim_due_feeds(now=None):
+    """
+    Return the ids of the feeds that are due and push their next poll time
+    out by the lease, so they are not dispatched twice while queued. The
+    feeds are locked while they are claimed, so overlapping runs do not both
+    dispatch them.
+    """
+    now = now or timezone.now()
+    lease = timedelta(seconds=get_setting("POLL_LEASE"))
+    with transaction.atomic():
+        feed_ids = list(
+            get_due_feeds(now).select_for_update().values_list(
+                "id", flat=True
+            )
+        )
+        # Only the feeds selected, others may have become due since and are
+        # left for the next run
+        for i in range(0, len(feed_ids), CLAIM_CHUNK_SIZE):
+            Feed.objects.filter(
+                pk__in=feed_ids[i:i + CLAIM_CHUNK_SIZE]
+            ).update(next_poll_at=now + lease)
+    return feed_ids
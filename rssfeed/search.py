@@ -0,0 +1,138 @@
+"""
+Full-text search over entry titles and descriptions.
+
+On PostgreSQL entries are matched against a GIN expression index on their
+text search vector, and on SQLite against an FTS5 table kept up to date by
+triggers. Both are maintained by the database as entries are stored. Other
+databases fall back to case insensitive substring matches.
+
+SQLite rebuilds a table to alter it, dropping its triggers, so migrations
+altering Entry run install_search_index again. SQLite built without FTS5
+gets no table and falls back as well.
+"""
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+
+# Text search configuration of the PostgreSQL index. Queries must use the
+# same expression for the index to be used.
+SEARCH_CONFIG = "english"
+SEARCH_DOCUMENT = (
+    "to_tsvector('%s', coalesce(rssfeed_entry.title, '') || ' ' || "
+    "coalesce(rssfeed_entry.description, ''))" % SEARCH_CONFIG
+)
+SEARCH_INDEX = "rssfeed_entry_search"
+FTS_TABLE = "rssfeed_entry_fts"
+# Whether the FTS table exists, by connection alias, so searches do not
+# list the tables of the database every time
+fts_tables = {}
+
+POSTGRESQL_INSTALL = [
+    "CREATE INDEX IF NOT EXISTS %s ON rssfeed_entry USING GIN (%s)" % (
+        SEARCH_INDEX, SEARCH_DOCUMENT.replace("rssfeed_entry.", "")
+    ),
+]
+POSTGRESQL_UNINSTALL = ["DROP INDEX IF EXISTS %s" % SEARCH_INDEX]
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS %(fts)s USING fts5("
+    "title, description, content='rssfeed_entry', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS %(fts)s_insert AFTER INSERT ON "
+    "rssfeed_entry BEGIN "
+    "INSERT INTO %(fts)s(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS %(fts)s_delete AFTER DELETE ON "
+    "rssfeed_entry BEGIN "
+    "INSERT INTO %(fts)s(%(fts)s, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS %(fts)s_update AFTER UPDATE ON "
+    "rssfeed_entry BEGIN "
+    "INSERT INTO %(fts)s(%(fts)s, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO %(fts)s(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    # Index the entries stored before the table or its triggers existed
+    "INSERT INTO %(fts)s(%(fts)s) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS %(fts)s_insert",
+    "DROP TRIGGER IF EXISTS %(fts)s_delete",
+    "DROP TRIGGER IF EXISTS %(fts)s_update",
+    "DROP TABLE IF EXISTS %(fts)s",
+]
+
+
+def get_statements(vendor, install=True):
+    if vendor == "postgresql":
+        return POSTGRESQL_INSTALL if install else POSTGRESQL_UNINSTALL
+    if vendor == "sqlite":
+        statements = SQLITE_INSTALL if install else SQLITE_UNINSTALL
+        return [statement % {"fts": FTS_TABLE} for statement in statements]
+    return []
+
+
+def install_search_index(apps, schema_editor):
+    """
+    Create the search index, for use with RunPython in migrations.
+    """
+    vendor = schema_editor.connection.vendor
+    fts_tables.pop(schema_editor.connection.alias, None)
+    try:
+        # In a savepoint so the triggers are not left without their table
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for statement in get_statements(vendor):
+                schema_editor.execute(statement)
+    except OperationalError:
+        # SQLite built without FTS5
+        if vendor != "sqlite":
+            raise
+
+
+def uninstall_search_index(apps, schema_editor):
+    fts_tables.pop(schema_editor.connection.alias, None)
+    for statement in get_statements(
+            schema_editor.connection.vendor, install=False):
+        schema_editor.execute(statement)
+
+
+def has_fts_table():
+    if connection.alias not in fts_tables:
+        fts_tables[connection.alias] = (
+            FTS_TABLE in connection.introspection.table_names()
+        )
+    return fts_tables[connection.alias]
+
+
+def get_fts_query(query):
+    # Quote every word so FTS5 query syntax in the search is taken literally
+    return " ".join(
+        '"%s"' % word.replace('"', '""') for word in query.split()
+    )
+
+
+def search_entries(entries, query):
+    """
+    Filter a queryset of entries to those whose title or description
+    matches every word of the query.
+    """
+    if not query.strip():
+        return entries
+    if connection.vendor == "postgresql":
+        return entries.extra(
+            where=["%s @@ plainto_tsquery('%s', %%s)" % (
+                SEARCH_DOCUMENT, SEARCH_CONFIG
+            )],
+            params=[query]
+        )
+    if connection.vendor == "sqlite" and has_fts_table():
+        return entries.extra(
+            where=[
+                "rssfeed_entry.id IN (SELECT rowid FROM %s WHERE %s MATCH %%s)"
+                % (FTS_TABLE, FTS_TABLE)
+            ],
+            params=[get_fts_query(query)]
+        )
+    for word in query.split():
+        entries = entries.filter(
+            Q(title__icontains=word) | Q(description__icontains=word)
+        )
+    return entries
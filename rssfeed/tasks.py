@@ -1,17 +1,41 @@
+import hashlib
+import random
 from datetime import datetime
+from functools import partial
 from time import mktime
 
+import billiard
 import feedparser
-import BeautifulSoup
+from celery import group
 from celery.schedules import crontab
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.encoding import force_text, smart_str
 from celery.task import periodic_task, task
-from rssfeed.models import Entry, Feed
+from rssfeed import metrics, retention
+from rssfeed.caching import (
+    add_seen_entries, bump_entries_version, get_seen_entries
+)
+from rssfeed.conf import get_setting
+from rssfeed.fetch import FetchError, get_fetcher
+from rssfeed.identity import get_guid, get_identities
+from rssfeed.images import get_entry_image
+from rssfeed.models import Entry, Feed, make_guid_hash, make_link_hash
+from rssfeed.scheduling import (
+    claim_due_feeds, get_hint_interval, get_success_attrs, schedule_failure,
+    schedule_next_poll
+)
+from rssfeed.text import strip_html
 
 MAX = 20
 MAX_LENGTH = 2000
 
 
+class MalformedFeedError(Exception):
+    pass
+
+
 @task()
 def poll_feed(pk_feed, verbose=False):
     """
@@ -22,44 +46,276 @@ def poll_feed(pk_feed, verbose=False):
 
     """
     db_feed = Feed.objects.get(pk=pk_feed)
-    parsed = feedparser.parse(db_feed.url)
-
-    check_malformed_feed(parsed, db_feed, verbose)
+    try:
+        result = get_fetcher().fetch(
+            db_feed.url, db_feed.etag, db_feed.modified, max_items=MAX
+        )
+        parsed = None
+        if not is_unchanged(db_feed, result):
+            parsed = parse_result(result, verbose, db_feed.newest_entry_hash)
+        update_feed(db_feed, result, parsed, verbose)
+    except Exception as e:
+        metrics.incr("polls", outcome="failed", feed=db_feed.pk)
+        schedule_failure(db_feed, e)
+        raise
+    finally:
+        metrics.flush()
 
-    check_feed_attrs(parsed, db_feed, verbose)
 
-    db_feed = get_feed_attrs(parsed, db_feed)
+@task()
+def poll_feed_batch(pk_feeds, verbose=False):
+    """
+    Fetch a batch of feeds concurrently, parse them and store the results.
 
-    db_feed.save()
+    pk_feeds: The ids of the feeds to poll
+    verbose: True for debugging purposes
 
-    parse_entries(parsed, db_feed, verbose)
+    """
+    db_feeds = list(Feed.objects.filter(pk__in=pk_feeds))
+    results = get_fetcher().fetch_many(
+        [(db_feed.url, db_feed.etag, db_feed.modified)
+         for db_feed in db_feeds],
+        max_items=MAX
+    )
+    parsed_results = parse_many(
+        [None if is_unchanged(db_feed, result) else result
+         for db_feed, result in zip(db_feeds, results)],
+        verbose,
+        [db_feed.newest_entry_hash for db_feed in db_feeds]
+    )
+    for db_feed, result, parsed in zip(db_feeds, results, parsed_results):
+        try:
+            update_feed(db_feed, result, parsed, verbose)
+        except Exception as e:
+            metrics.incr("polls", outcome="failed", feed=db_feed.pk)
+            schedule_failure(db_feed, e)
+            if verbose:
+                # Encoded so a url or error outside ASCII cannot make the
+                # print raise and end the batch
+                print(smart_str(
+                    u'rssfeed poll_feed_batch. Feed "%s" failed: %s' % (
+                        db_feed.url, force_text(e, errors="replace"))
+                ))
+    metrics.flush()
 
 
-@periodic_task(run_every=crontab(minute="*/15"), ignore_result=True)
+@periodic_task(run_every=crontab(), ignore_result=True)
 def poll_feeds(verbose=False):
-    for feed_id in Feed.objects.values_list("id", flat=True):
-        try:
-            poll_feed.delay(feed_id, verbose)
-        except Exception as e:
-            print(e.message)
+    """
+    Enqueue the feeds that are due in batches of RSSFEED_POLL_BATCH_SIZE,
+    spread over RSSFEED_POLL_JITTER seconds.
+    """
+    jitter = get_setting("POLL_JITTER")
+    size = get_setting("POLL_BATCH_SIZE")
+    feed_ids = claim_due_feeds()
+    if not feed_ids:
+        return
+    batches = [
+        poll_feed_batch.subtask(
+            (feed_ids[i:i + size], verbose),
+            countdown=random.uniform(0, jitter)
+        )
+        for i in range(0, len(feed_ids), size)
+    ]
+    try:
+        # Published over a single connection to the broker
+        group(batches).apply_async()
+    except Exception as e:
+        print(e.message)
+
+
+@task()
+def make_thumbnails(db_feed_id, link_hashes, verbose=False):
+    """
+    Make local thumbnails of the images of new entries of a feed.
+
+    db_feed_id: The id of the feed of the entries
+    link_hashes: The link hashes of the entries
+
+    """
+    # photologue can only be imported when it is installed
+    from rssfeed import thumbnails
+    entries = Entry.objects.filter(
+        feed_id=db_feed_id, link_hash__in=link_hashes,
+        thumbnail__isnull=True
+    ).exclude(image__isnull=True).exclude(image="")
+    if thumbnails.make_thumbnails(list(entries), verbose):
+        bump_entries_version()
+
+
+@periodic_task(run_every=crontab(minute=0), ignore_result=True)
+def prune_entries(verbose=False):
+    """
+    Delete the entries outside the retention policy.
+    """
+    deleted = retention.prune_entries()
+    if verbose:
+        print("rssfeed prune_entries. Deleted %d entries" % deleted)
+
+
+# Parse stage. These functions only use CPU and never touch the database,
+# so they can run in a separate process. Their result is a plain dict.
+
+def parse_result(result, verbose=False, newest_entry_hash=None):
+    """
+    Parse a FetchResult. Returns None when there is nothing to parse.
+    """
+    if result is None or result.error or result.not_modified:
+        return None
+    with metrics.timer("parse"):
+        return parse_feed(
+            result.body, result.response_headers, result.url, verbose,
+            newest_entry_hash
+        )
+
+
+def parse_result_or_error(result, verbose=False, newest_entry_hash=None):
+    # Exceptions are returned rather than raised so one bad feed does not
+    # fail the rest of its batch.
+    try:
+        return parse_result(result, verbose, newest_entry_hash)
+    except Exception as e:
+        return e
+
+
+def parse_job(job, verbose=False):
+    # Pool.map passes a single argument, the result and the newest entry
+    # hash of its feed
+    result, newest_entry_hash = job
+    return parse_result_or_error(result, verbose, newest_entry_hash)
+
+
+def parse_job_recorded(job, verbose=False):
+    # Metrics reported on the process pool would never be flushed there, so
+    # they are returned with the result
+    with metrics.recording() as records:
+        parsed = parse_job(job, verbose)
+    return parsed, records
+
+
+_parse_pool = None
+
+
+def get_parse_pool():
+    global _parse_pool
+    if _parse_pool is None:
+        # billiard, unlike multiprocessing, may start processes from within
+        # a daemonic Celery worker process.
+        _parse_pool = billiard.Pool(get_setting("PARSE_PROCESSES"))
+    return _parse_pool
+
+
+def parse_many(results, verbose=False, newest_entry_hashes=None):
+    """
+    Parse a list of FetchResults, on the process pool when
+    RSSFEED_PARSE_PROCESSES is set. newest_entry_hashes are those of the
+    feeds of the results, see get_new_entries.
+    """
+    if newest_entry_hashes is None:
+        newest_entry_hashes = [None] * len(results)
+    jobs = list(zip(results, newest_entry_hashes))
+    if not get_setting("PARSE_PROCESSES"):
+        return [parse_job(job, verbose) for job in jobs]
+    parsed_results = []
+    for parsed, records in get_parse_pool().map(
+            partial(parse_job_recorded, verbose=verbose), jobs):
+        metrics.replay(records)
+        parsed_results.append(parsed)
+    return parsed_results
+
+
+def parse_feed(body, headers=None, url=None, verbose=False,
+               newest_entry_hash=None):
+    """
+    Parse a feed document into the attributes of the feed, its polling
+    hint and the attributes of its first MAX usable entries, down to the
+    entry with newest_entry_hash. Raises MalformedFeedError for a malformed
+    document without usable entries.
+    """
+    parsed = feedparser.parse(body, response_headers=headers)
+
+    error = check_malformed_feed(parsed, url, verbose)
+
+    check_feed_attrs(parsed, url, verbose)
+
+    usable = get_usable_entries(parsed, verbose)
+    if error is not None and not usable:
+        raise MalformedFeedError('Malformed feed "%s": %s' % (url, error))
+    link_hashes = [make_link_hash(entry.link) for entry in usable]
+    return {
+        "feed": get_feed_attrs(parsed),
+        "hint": get_hint_interval(parsed),
+        "entries": get_new_entries(
+            usable, link_hashes, verbose, newest_entry_hash
+        ),
+        "entries_digest": hashlib.sha1(
+            "\n".join(link_hashes).encode("utf-8")
+        ).hexdigest(),
+        "newest_entry_hash": link_hashes[0] if link_hashes else None,
+    }
+
+
+def get_new_entries(entries, link_hashes, verbose, newest_entry_hash=None):
+    """
+    Return the attributes of the entries before the one with
+    newest_entry_hash, the newest entry of the last poll. Only feeds listing
+    their entries newest first stop there, in others a new entry may come
+    after it.
+    """
+    if newest_entry_hash is not None and not is_newest_first(entries):
+        newest_entry_hash = None
+    new_entries = []
+    for entry, link_hash in zip(entries, link_hashes):
+        if link_hash == newest_entry_hash:
+            metrics.incr("entries_skipped", len(entries) - len(new_entries))
+            break
+        attrs = get_entry_attrs(entry, verbose)
+        attrs["link"] = entry.link
+        attrs["link_hash"] = link_hash
+        guid = get_guid(entry)
+        if guid is not None:
+            attrs["guid_hash"] = make_guid_hash(guid)
+        new_entries.append(attrs)
+    return new_entries
+
+
+def is_newest_first(entries):
+    """
+    Whether every entry has a published date, none later than the one
+    before it.
+    """
+    dates = [getattr(entry, "published_parsed", None) for entry in entries]
+    if None in dates:
+        return False
+    return all(a >= b for a, b in zip(dates, dates[1:]))
 
 
-def parse_entries(parsed, db_feed, verbose):
+def get_usable_entries(parsed, verbose):
+    """
+    Return the entries among the first MAX of a parsed feed that have a
+    link and a title that is not blank. Entries without a link cannot be
+    identified, so they are skipped rather than failing the poll.
+    """
     # Check how many entries were parsed in this poll
     if verbose:
         print(
             "%d entries to process in %s" %
-            (len(parsed.entries), db_feed.title)
+            (len(parsed.entries), parsed.feed.get("title"))
         )
+    entries = []
     for i, entry in enumerate(parsed.entries):
         if i >= MAX:
             break
+        link = getattr(entry, "link", None)
+        name = link or getattr(entry, "title", None) or i
         for attr in ["title", "title_detail", "link", "description"]:
             if not hasattr(entry, attr):
                 if verbose:
                     msg = 'rssfeed poll_feeds. Entry "%s" has no %s' % (
-                        entry.link, attr)
+                        name, attr)
                     print(msg)
+        if not link:
+            continue
         if hasattr(entry, "title"):
             if entry.title == "":
                 if verbose:
@@ -67,132 +323,311 @@ def parse_entries(parsed, db_feed, verbose):
                           % entry.link
                     print(msg)
                 continue
-        db_entry, created = Entry.objects.get_or_create(
-            feed=db_feed,
-            link=entry.link
-        )
+        entries.append(entry)
+    return entries
 
-        if created:
-            db_entry = get_entry_attrs(entry, db_entry, verbose)
-            db_entry.save()
 
-
-def get_feed_attrs(parsed, db_feed):
+def get_feed_attrs(parsed):
+    attrs = {}
     if hasattr(parsed.feed, "published_parsed"):
-        # import pdb; pdb.set_trace()
-        published = datetime.fromtimestamp(
+        attrs["published"] = datetime.fromtimestamp(
             mktime(parsed.feed.published_parsed)
         )
-        db_feed.published = published
 
     # Get the title of the RSS feed
     if len(parsed.feed.title) > MAX_LENGTH:
-        db_feed.title = parsed.feed.title[0:MAX_LENGTH - 1]
+        attrs["title"] = parsed.feed.title[0:MAX_LENGTH - 1]
     else:
-        db_feed.title = parsed.feed.title
+        attrs["title"] = parsed.feed.title
 
     if hasattr(parsed.feed, "description_detail") \
             and hasattr(parsed.feed, "description"):
-        db_feed.description = parsed.feed.description
+        attrs["description"] = parsed.feed.description
     else:
-        db_feed.description = ""
-    db_feed.last_polled = timezone.now()
+        attrs["description"] = ""
 
     if hasattr(parsed.feed, "image"):
         if len(parsed.feed.image.href) > MAX_LENGTH:
-            db_feed.image = ""
+            attrs["image"] = ""
         else:
-            db_feed.image = parsed.feed.image.href
+            attrs["image"] = parsed.feed.image.href
     else:
-        db_feed.image = ""
+        attrs["image"] = ""
 
-    return db_feed
+    return attrs
 
 
-def get_entry_attrs(entry, db_entry, verbose):
+def get_entry_attrs(entry, verbose):
+    attrs = {}
     if hasattr(entry, "published_parsed"):
-        published = datetime.fromtimestamp(
+        attrs["published"] = datetime.fromtimestamp(
             mktime(entry.published_parsed)
         )
-        db_entry.published = published
     if hasattr(entry, "title"):
         if len(entry.title) > MAX_LENGTH:
-            db_entry.title = entry.title[0:MAX_LENGTH - 1]
+            attrs["title"] = entry.title[0:MAX_LENGTH - 1]
         else:
-            db_entry.title = entry.title
+            attrs["title"] = entry.title
 
     # Mock does not support indexing. Verbose is set to True in test
     # Different APIs have differently named keys for the media content
     if hasattr(entry, "media_thumbnail"):
-        if len(entry.media_thumbnail[0]["url"]) > MAX_LENGTH:
-            db_entry.image = ""
-        else:
-            db_entry.image = entry.media_thumbnail[0]["url"]
+        attrs["image"] = get_media_url(entry.media_thumbnail)
     elif hasattr(entry, "media_context"):
-        if len(entry.media_context[0]["url"]) > MAX_LENGTH:
-            db_entry.image = ""
-        else:
-            db_entry.image = entry.media_context[0]["url"]
+        attrs["image"] = get_media_url(entry.media_context)
     elif hasattr(entry, "media_content"):
-        if len(entry.media_content[0]["url"]) > MAX_LENGTH:
-            db_entry.image = ""
-        else:
-            db_entry.image = entry.media_content[0]["url"]
-    elif hasattr(entry, "summary") and not verbose:
-        if has_summary_image(entry):
-            db_entry.image = find_article_image(entry.summary)
-        else:
-            db_entry.image = ""
+        attrs["image"] = get_media_url(entry.media_content)
+    elif not verbose:
+        attrs["image"] = get_entry_image(entry)
     if hasattr(entry, "description"):
-        desc = BeautifulSoup.BeautifulSoup(entry.description).text
-        db_entry.description = desc
+        with metrics.timer("strip_html"):
+            attrs["description"] = strip_html(entry.description)
     else:
-        db_entry = ""
+        attrs["description"] = ""
+
+    return attrs
 
-    return db_entry
+
+def get_media_url(media):
+    # feedparser returns a list for the media elements it knows about and a
+    # single dict for the others, such as media:context
+    if isinstance(media, dict):
+        media = [media]
+    try:
+        url = media[0]["url"]
+    except (IndexError, KeyError, TypeError):
+        return ""
+    if len(url) > MAX_LENGTH:
+        return ""
+    return url
 
 
-def check_feed_attrs(parsed, db_feed, verbose):
+def check_feed_attrs(parsed, url, verbose):
     for attr in ["title", "title_detail", "link"]:
         if not hasattr(parsed.feed, attr):
             if verbose:
                 msg = 'rssfeed poll_feeds. Feed "%s" has no %s' % (
-                    db_feed.url, attr)
+                    url, attr)
                 print(msg)
             return
 
 
-def check_malformed_feed(parsed, db_feed, verbose):
-    if hasattr(parsed.feed, "bozo_exception"):
-        if verbose:
-            # Malformed feed
-            msg = 'Rssfeed poll_feeds found Malformed feed, "%s": %s' % (
-                db_feed.url, parsed.feed.bozo_exception)
-            print(msg)
-        return
+def check_malformed_feed(parsed, url, verbose):
+    """
+    Return the error feedparser found the document malformed with, or None.
+    """
+    error = getattr(parsed.feed, "bozo_exception", None)
+    if error is None and isinstance(parsed, dict):
+        error = parsed.get("bozo_exception")
+    if error is not None and verbose:
+        # Malformed feed
+        msg = 'Rssfeed poll_feeds found Malformed feed, "%s": %s' % (
+            url, error)
+        print(msg)
+    return error
 
 
-def has_summary_image(entry):
-    if entry.summary and (
-                    entry.summary.find(".jpg") or
-                    entry.summary.find(".gif") or
-                    entry.summary.find(".png")
-    ):
-        return True
-    else:
-        return False
+# Write stage
+
+def update_feed(db_feed, result, parsed, verbose=False):
+    """
+    Store the parsed document of a feed and its new entries.
+    """
+    tags = {"feed": db_feed.pk}
+    if result.elapsed is not None:
+        metrics.get_backend().timing("fetch", result.elapsed, tags)
+    with metrics.timer("write", **tags):
+        with metrics.count_queries("queries", **tags):
+            outcome = store_feed(db_feed, result, parsed, verbose)
+    metrics.incr("polls", outcome=outcome, **tags)
 
 
-def find_article_image(summary):
-    if summary.find("jpg"):
-        image = summary[summary.find("http"):summary.find("jpg") + 3]
-    elif summary.find("png"):
-        image = summary[summary.find("http"):summary.find("png") + 3]
-    elif summary.find("gif"):
-        image = summary[summary.find("http"):summary.find("gif") + 3]
+def store_feed(db_feed, result, parsed, verbose=False):
+    """
+    Write stage of update_feed. Returns the outcome of the poll: either
+    "not_modified", "unchanged" or "updated".
+    """
+    if result.error:
+        raise FetchError(result.error)
+    if isinstance(parsed, Exception):
+        raise parsed
+
+    # Nothing changed since the last poll, only reschedule it
+    if is_unchanged(db_feed, result):
+        if verbose:
+            print('rssfeed poll_feeds. Feed "%s" not modified' % db_feed.url)
+        schedule_next_poll(db_feed, False)
+        fields = dict(
+            get_success_attrs(),
+            poll_interval=db_feed.poll_interval,
+            next_poll_at=db_feed.next_poll_at
+        )
+        if not result.not_modified:
+            fields.update(etag=result.etag, modified=result.modified)
+        Feed.objects.filter(pk=db_feed.pk).update(**fields)
+        return "not_modified" if result.not_modified else "unchanged"
+
+    attrs = dict(
+        parsed["feed"],
+        etag=result.etag,
+        modified=result.modified,
+        body_digest=result.digest,
+        newest_entry_hash=parsed["newest_entry_hash"],
+        **get_success_attrs()
+    )
+
+    # The document changed but not its entries, e.g. a new lastBuildDate
+    if parsed["entries_digest"] == db_feed.entries_digest:
+        created = []
     else:
-        image = ""
-    if len(image) > 2000:
-        return ""
+        created = parse_entries(parsed["entries"], db_feed, verbose)
+        attrs["entries_digest"] = parsed["entries_digest"]
+
+    # Only write the columns that changed
+    changed = set_changed_attrs(db_feed, attrs)
+    db_feed.last_polled = timezone.now()
+    schedule_next_poll(db_feed, bool(created), parsed["hint"])
+    db_feed.save(update_fields=changed + [
+        "last_polled", "poll_interval", "next_poll_at",
+    ])
+    return "updated"
+
+
+def set_changed_attrs(instance, attrs):
+    """
+    Set attributes on a model instance, returning the names of those whose
+    value changed.
+    """
+    changed = []
+    for name, value in attrs.items():
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed.append(name)
+    return changed
+
+
+def is_unchanged(db_feed, result):
+    """
+    Whether a feed is known not to have changed since its last poll, from a
+    304 or because the server sent the very same document again.
+    """
+    return result.not_modified or (
+        result.body is not None and result.digest == db_feed.body_digest
+    )
+
+
+def parse_entries(entries, db_feed, verbose):
+    """
+    Store the entries of a feed that are not in the database yet. Returns
+    the entries that were created.
+    """
+    if not entries:
+        return []
+    with metrics.timer("parse_entries"):
+        created = store_entries(entries, db_feed, verbose)
+    metrics.incr("entries_seen", len(entries))
+    metrics.incr("entries_created", len(created))
+    return created
+
+
+def store_entries(entries, db_feed, verbose):
+    entries = retention.get_retained(entries)
+    # Entries the feed listed recently are skipped without a query
+    seen = get_seen_entries(db_feed.pk)
+    unseen = [
+        attrs for attrs in entries if not get_identities(attrs) & seen
+    ]
+    stored = get_stored_identities(unseen, db_feed)
+
+    new_entries = []
+    for attrs in unseen:
+        identities = get_identities(attrs)
+        if identities & stored:
+            continue
+        stored |= identities
+        new_entries.append(Entry(feed=db_feed, **attrs))
+
+    if verbose:
+        print("%d new entries in %s" % (len(new_entries), db_feed.title))
+    created = create_entries(new_entries)
+    if created:
+        bump_entries_version()
+        queue_thumbnails(db_feed, created)
+    add_seen_entries(
+        db_feed.pk,
+        set().union(*[get_identities(attrs) for attrs in entries])
+    )
+    return created
+
+
+def get_stored_identities(entries, db_feed):
+    """
+    Find which of the entries are already stored, by their guid in this feed
+    or their link in this feed or, with RSSFEED_DEDUPE_ACROSS_FEEDS, in any
+    feed, in a single query. Returns their identities.
+    """
+    if not entries:
+        return set()
+    link_hashes = [attrs["link_hash"] for attrs in entries]
+    guid_hashes = [
+        attrs["guid_hash"] for attrs in entries if attrs.get("guid_hash")
+    ]
+    if get_setting("DEDUPE_ACROSS_FEEDS"):
+        query = Q(link_hash__in=link_hashes)
     else:
-        return image
+        query = Q(feed=db_feed, link_hash__in=link_hashes)
+    if guid_hashes:
+        query |= Q(feed=db_feed, guid_hash__in=guid_hashes)
+    stored = set()
+    for feed_id, link_hash, guid_hash in Entry.objects.filter(
+            query).values_list("feed_id", "link_hash", "guid_hash"):
+        stored.add(link_hash)
+        # Guids are only unique within a feed, another feed may reuse them
+        if guid_hash and feed_id == db_feed.pk:
+            stored.add(guid_hash)
+    return stored
+
+
+def queue_thumbnails(db_feed, created):
+    """
+    Enqueue make_thumbnails for the new entries with an image, when
+    RSSFEED_THUMBNAIL_SIZE is set.
+    """
+    if not get_setting("THUMBNAIL_SIZE"):
+        return
+    link_hashes = [
+        db_entry.link_hash for db_entry in created if db_entry.image
+    ]
+    if not link_hashes:
+        return
+    try:
+        make_thumbnails.delay(db_feed.pk, link_hashes)
+    except Exception as e:
+        # Entries keep their remote image
+        print(e.message)
+
+
+def create_entries(new_entries):
+    """
+    Insert new entries, skipping any that a concurrent poll of the same feed
+    has already stored. Returns the entries that were actually created.
+    """
+    if not new_entries:
+        return []
+    try:
+        with transaction.atomic():
+            Entry.objects.bulk_create(new_entries)
+        return new_entries
+    except IntegrityError:
+        pass
+
+    # Fall back to one insert per entry so a conflict only drops that entry
+    created = []
+    for db_entry in new_entries:
+        try:
+            with transaction.atomic():
+                db_entry.save(force_insert=True)
+        except IntegrityError:
+            continue
+        created.append(db_entry)
+    return created
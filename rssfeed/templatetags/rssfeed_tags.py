@@ -1,7 +1,27 @@
+import hashlib
+import re
+
 from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
+from django.utils.timesince import timesince
 
+from rssfeed.caching import get_entries_version
+from rssfeed.conf import get_setting
 from rssfeed.models import Entry
 
+ENTRY_TEMPLATE = "rssfeed/inclusion_tags/render_rssfeed_entry.html"
+# Stands in for the time since an entry was published in its cached
+# fragment, replaced on every render
+AGO_PLACEHOLDER = "[[rssfeed:ago]]"
+# The same for the entry at an index of the cached output of
+# render_rssfeed_cached
+INDEXED_AGO_PLACEHOLDER = "[[rssfeed:ago:%s]]"
+INDEXED_AGO = re.compile(r"\[\[rssfeed:ago:(\d+)\]\]")
+
 register = template.Library()
 
 
@@ -9,3 +29,87 @@ register = template.Library()
 def render_rssfeed(count=5):
     entries = Entry.objects.all().select_related("feed")[:count]
     return {"entries": entries}
+
+
+@register.simple_tag
+def render_rssfeed_cached(count=5):
+    """
+    Same as render_rssfeed, cached until new entries are stored. Only the
+    time since each entry was published is computed on every render.
+    """
+    key = "rssfeed:render_rssfeed:%s:%s:%s:%s" % (
+        get_entries_version(), translation.get_language(),
+        timezone.get_current_timezone_name(), count
+    )
+    cached = cache.get(key)
+    if cached is None:
+        entries = list(render_rssfeed(count)["entries"])
+        for index, entry in enumerate(entries):
+            entry.rendered = mark_safe(render_to_string(ENTRY_TEMPLATE, {
+                "entry": entry, "ago": INDEXED_AGO_PLACEHOLDER % index
+            }))
+        cached = (
+            render_to_string(
+                "rssfeed/inclusion_tags/render_rssfeed.html",
+                {"entries": entries}
+            ),
+            [entry.published for entry in entries]
+        )
+        cache.set(key, cached, get_setting("RENDER_CACHE_TIMEOUT"))
+    rendered, published = cached
+
+    def get_ago(match):
+        index = int(match.group(1))
+        # Left alone when it is not one of ours, such as in an entry title
+        if index >= len(published):
+            return match.group(0)
+        return timesince(published[index])
+
+    return mark_safe(INDEXED_AGO.sub(get_ago, rendered))
+
+
+def get_fragment_key(entry):
+    """
+    Return the cache key of the rendered fragment of an entry. Entries are
+    not changed once stored, other than by getting a thumbnail, so the key
+    holds a digest of the thumbnail and of the feed fields rendered with it.
+    """
+    feed = entry.feed
+    digest = hashlib.md5(u"\n".join(
+        force_text(value or "") for value in [
+            entry.thumbnail, feed.title, feed.image.name, feed.link,
+            feed.description,
+        ]
+    ).encode("utf-8")).hexdigest()[:8]
+    return "rssfeed:render_entry:%s:%s:%s:%s:%s" % (
+        get_setting("RENDER_VERSION"), translation.get_language(),
+        timezone.get_current_timezone_name(), entry.pk, digest
+    )
+
+
+@register.simple_tag
+def render_rssfeed_fragments(count=5):
+    """
+    Same as render_rssfeed, each entry rendered once and its fragment cached.
+    Only the time since each entry was published is computed on every
+    render.
+    """
+    entries = list(Entry.objects.all().select_related("feed")[:count])
+    keys = [get_fragment_key(entry) for entry in entries]
+    fragments = cache.get_many(keys)
+    missing = {}
+    for entry, key in zip(entries, keys):
+        fragment = fragments.get(key)
+        if fragment is None:
+            fragment = render_to_string(
+                ENTRY_TEMPLATE, {"entry": entry, "ago": AGO_PLACEHOLDER}
+            )
+            missing[key] = fragment
+        entry.rendered = mark_safe(
+            fragment.replace(AGO_PLACEHOLDER, timesince(entry.published))
+        )
+    if missing:
+        cache.set_many(missing, get_setting("RENDER_CACHE_TIMEOUT"))
+    return mark_safe(render_to_string(
+        "rssfeed/inclusion_tags/render_rssfeed.html", {"entries": entries}
+    ))
@@ -0,0 +1,358 @@
+"""
+Benchmarks for the feed polling pipeline.
+
+Synthetic RSS and Atom feeds of increasing size, with and without media
+tags, are served by the local test server and run through each stage of a
+poll. For every stage the mean wall time, the number of database queries
+and the peak memory are reported. The peak is that of the memory traced by
+tracemalloc, or without it the growth of the resident set of one more run
+in a child process. Run against a test database with::
+
+    DJANGO_SETTINGS_MODULE=rssfeed.tests.settings.19 \\
+        python -m rssfeed.tests.benchmarks
+
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import resource
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+import django
+
+SIZES = [10, 100, 1000, 10000]
+FORMATS = ["rss", "atom"]
+PORT = 8018
+
+# Entry summaries for the image extraction microbenchmark
+PARAGRAPH = (
+    "<p>Read <a href=\"http://example.com/story\">the story</a> on the "
+    "site.</p>"
+)
+SUMMARIES = {
+    "no image": PARAGRAPH * 20,
+    "image first": (
+        "<img alt=\"\" src=\"http://example.com/image.jpg\" />" +
+        PARAGRAPH * 20
+    ),
+    "image last": (
+        PARAGRAPH * 20 + "<img src='http://example.com/image.png'>"
+    ),
+}
+# Entry descriptions for the HTML to text microbenchmark
+DESCRIPTIONS = {
+    "short": "<p>Description of <b>item</b> 1</p>",
+    "long": PARAGRAPH * 200,
+}
+
+
+class Measurement(object):
+
+    def __init__(self, stage, variant, seconds, queries, peak):
+        self.stage = stage
+        self.variant = variant
+        self.seconds = seconds
+        self.queries = queries
+        self.peak = peak
+
+    def __str__(self):
+        return "%-20s %-20s %10.2f %8s %10s" % (
+            self.stage, self.variant, self.seconds * 1000, self.queries,
+            self.peak
+        )
+
+
+def get_child_peak_memory(func, setup=None):
+    """
+    Return how much the peak resident memory in KB grew during one more run
+    of ``func`` in a child process, so the peak of earlier stages does not
+    hide it. Returns None if the run failed.
+    """
+    from django.db import connection
+
+    from rssfeed import fetch
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        try:
+            os.close(read_fd)
+            # The sockets of the parent are shared, so its fetcher and
+            # database session are neither used nor closed. The threads of
+            # its fetcher were not forked either.
+            inherited = [fetch._fetcher]  # noqa: F841
+            fetch._fetcher = None
+            if connection.vendor != "sqlite":
+                inherited.append(connection.connection)
+                connection.connection = None
+            if setup is not None:
+                setup()
+            start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            func()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write_fd, str(peak - start).encode("ascii"))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as output:
+        peak = output.read()
+    os.waitpid(pid, 0)
+    return int(peak) if peak else None
+
+
+def measure(stage, variant, func, repeat=1, setup=None):
+    """
+    Run ``func`` ``repeat`` times and return its last result along with a
+    Measurement of the mean time and queries of one run.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    else:
+        peak = get_child_peak_memory(func, setup)
+    elapsed = 0
+    query_count = 0
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        with CaptureQueriesContext(connection) as queries:
+            start = timeit.default_timer()
+            result = func()
+            elapsed += timeit.default_timer() - start
+        query_count += len(queries)
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return result, Measurement(
+        stage, variant, elapsed / repeat, query_count // repeat, peak
+    )
+
+
+def legacy_find_image(summary):
+    # Summary image lookup as it was before rssfeed.images
+    if summary and (
+        summary.find(".jpg") or summary.find(".gif") or summary.find(".png")
+    ):
+        if summary.find("jpg"):
+            image = summary[summary.find("http"):summary.find("jpg") + 3]
+        elif summary.find("png"):
+            image = summary[summary.find("http"):summary.find("png") + 3]
+        elif summary.find("gif"):
+            image = summary[summary.find("http"):summary.find("gif") + 3]
+        else:
+            image = ""
+        if len(image) > 2000:
+            return ""
+        return image
+    return ""
+
+
+def benchmark_images(repeat, count=1000):
+    """
+    Compare finding the image of ``count`` summaries with rssfeed.images
+    and with the code it replaced.
+    """
+    from rssfeed.images import find_summary_image
+
+    results = []
+    for variant, summary in sorted(SUMMARIES.items()):
+        for name, find in [
+            ("legacy_find_image", legacy_find_image),
+            ("find_image", find_summary_image),
+        ]:
+            _, measurement = measure(
+                "%s/%s" % (name, count), variant,
+                lambda: [find(summary) for i in range(count)], repeat
+            )
+            results.append(measurement)
+    return results
+
+
+def benchmark_text(repeat, count=100):
+    """
+    Compare converting ``count`` descriptions to text with each of the
+    backends in rssfeed.text.
+    """
+    from rssfeed.conf import get_setting
+    from rssfeed.text import beautifulsoup_to_text, html_to_text
+
+    max_length = get_setting("DESCRIPTION_MAX_LENGTH")
+    results = []
+    for variant, description in sorted(DESCRIPTIONS.items()):
+        for name, to_text in [
+            ("beautifulsoup_to_text", beautifulsoup_to_text),
+            ("html_to_text", html_to_text),
+        ]:
+            _, measurement = measure(
+                "%s/%s" % (name, count), variant,
+                lambda: [
+                    to_text(description, max_length) for i in range(count)
+                ], repeat
+            )
+            results.append(measurement)
+    return results
+
+
+def benchmark_feed(url, variant, repeat):
+    from django.template import Context, Template
+
+    from rssfeed.fetch import fetch
+    from rssfeed.models import Entry, Feed
+    from rssfeed.tasks import (
+        MAX, get_entry_attrs, parse_entries, parse_feed, poll_feed
+    )
+    import feedparser
+
+    results = []
+
+    result, measurement = measure(
+        "fetch", variant, lambda: fetch(url, max_items=MAX), repeat
+    )
+    results.append(measurement)
+
+    full, measurement = measure(
+        "fetch (full)", variant, lambda: fetch(url), repeat
+    )
+    results.append(measurement)
+
+    parsed, measurement = measure(
+        "parse_feed", variant,
+        lambda: parse_feed(result.body, result.response_headers, url),
+        repeat
+    )
+    results.append(measurement)
+
+    document = feedparser.parse(full.body)
+    _, measurement = measure(
+        "feedparser (full)", variant,
+        lambda: feedparser.parse(full.body), repeat
+    )
+    results.append(measurement)
+
+    entries = document.entries[:MAX]
+    _, measurement = measure(
+        "get_entry_attrs", variant,
+        lambda: [get_entry_attrs(entry, False) for entry in entries],
+        repeat
+    )
+    measurement.seconds /= max(len(entries), 1)
+    measurement.stage = "get_entry_attrs/1"
+    results.append(measurement)
+
+    Feed.objects.bulk_create([Feed(url=url)])
+    db_feed = Feed.objects.get(url=url)
+
+    def clear_entries():
+        Entry.objects.filter(feed=db_feed).delete()
+
+    _, measurement = measure(
+        "parse_entries (new)", variant,
+        lambda: parse_entries(parsed["entries"], db_feed, False),
+        repeat, setup=clear_entries
+    )
+    results.append(measurement)
+
+    _, measurement = measure(
+        "parse_entries (seen)", variant,
+        lambda: parse_entries(parsed["entries"], db_feed, False),
+        repeat
+    )
+    results.append(measurement)
+
+    def reset_feed():
+        clear_entries()
+        Feed.objects.filter(pk=db_feed.pk).update(
+            etag=None, modified=None, body_digest=None, entries_digest=None,
+            newest_entry_hash=None
+        )
+
+    _, measurement = measure(
+        "poll_feed", variant, lambda: poll_feed(db_feed.pk), repeat,
+        setup=reset_feed
+    )
+    results.append(measurement)
+
+    _, measurement = measure(
+        "poll_feed (304)", variant, lambda: poll_feed(db_feed.pk), repeat
+    )
+    results.append(measurement)
+
+    template = Template("{% load rssfeed_tags %}{% render_rssfeed 20 %}")
+    _, measurement = measure(
+        "render_rssfeed", variant,
+        lambda: template.render(Context({})), repeat
+    )
+    results.append(measurement)
+
+    Feed.objects.filter(pk=db_feed.pk).delete()
+    return results
+
+
+def run(sizes, formats, repeat, port):
+    from rssfeed.tests.simple_test_server import (
+        Handler, TestServer, start_server
+    )
+
+    server = start_server(TestServer(("", port), Handler))
+    print("%-20s %-20s %10s %8s %10s" % (
+        "stage", "feed", "ms", "queries", "peak KB"))
+    for measurement in benchmark_images(repeat) + benchmark_text(repeat):
+        print(measurement)
+    try:
+        for size in sizes:
+            for format in formats:
+                for media in [False, True]:
+                    path = "/generated/%s/%s%s" % (
+                        format, size, "/media" if media else "")
+                    variant = "%s %s%s" % (
+                        format, size, " media" if media else "")
+                    url = "http://localhost:%s%s" % (port, path)
+                    for measurement in benchmark_feed(url, variant, repeat):
+                        print(measurement)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=SIZES,
+        help="Number of items in the generated feeds"
+    )
+    parser.add_argument(
+        "--formats", nargs="+", default=FORMATS, choices=FORMATS
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs averaged per stage"
+    )
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    django.setup()
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment, teardown_test_environment
+    )
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        run(args.sizes, args.formats, args.repeat, args.port)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,5 +1,6 @@
-import os
 import glob
+import os
+import tempfile
 
 BASE_DIR = os.path.join(
     glob.glob(os.environ["VIRTUAL_ENV"] + "/lib/*/site-packages")[0],
@@ -30,9 +31,17 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
-    "django.contrib.staticfiles"
+    "django.contrib.staticfiles",
+    "django.contrib.sites",
+    "sortedm2m",
+    "photologue"
 ]
 
+SITE_ID = 1
+
+# photologue writes to the default storage as soon as it is imported
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), "rssfeed-tests")
+
 MIDDLEWARE_CLASSES = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -60,7 +69,6 @@ TEMPLATES = [
     },
 ]
 
-SITE_ID = 1
 STATIC_URL = "/static/"
 SECRET_KEY = "SECRET_KEY"
 EMAIL_BACKEND = "django.core.mail.backends.dummy.EmailBackend"
@@ -68,3 +76,10 @@ EMAIL_BACKEND = "django.core.mail.backends.dummy.EmailBackend"
 # Disable celery
 TASK_ALWAYS_EAGER = True
 BROKER_BACKEND = "memory"
+
+# Tests fetch from the local test server back to back
+RSSFEED_FETCH_PER_HOST_RATE = None
+
+# The cache outlives the test database, entries remembered as seen would
+# not be stored again
+RSSFEED_SEEN_ENTRIES_SIZE = 0
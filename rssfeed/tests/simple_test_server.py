@@ -1,5 +1,11 @@
 import SocketServer
+import gzip
+import hashlib
+import re
+import socket
+import sys
 import threading
+from io import BytesIO
 from SimpleHTTPServer import SimpleHTTPRequestHandler
 
 PORT = 8008
@@ -48,36 +54,170 @@ TEST_RSS = """<?xml version="1.0" encoding="UTF-8"?>
 </rss>"""
 
 
+def get_etag(body):
+    return '"%s"' % hashlib.md5(body).hexdigest()
+
+
+TEST_ETAG = get_etag(TEST_RSS)
+
+# /generated/<rss|atom>/<count>[/media] serves a synthetic feed with that
+# many items, optionally with media:thumbnail tags
+GENERATED_PATH = re.compile(r"^/generated/(rss|atom)/(\d+)(/media)?$")
+GENERATED_ITEM = """        <item>
+            <title>Generated item %(i)s</title>
+            <description><![CDATA[<p>Description of <b>item</b> %(i)s</p>]]></description>
+            <link>http://example.com/items/%(i)s</link>
+            <guid isPermaLink="true">http://example.com/items/%(i)s</guid>
+            <pubDate>Thu, 26 Jan 2017 13:51:01 GMT</pubDate>
+%(media)s        </item>
+"""
+GENERATED_ENTRY = """    <entry>
+        <title>Generated entry %(i)s</title>
+        <summary type="html">&lt;p&gt;Summary of &lt;b&gt;entry&lt;/b&gt; %(i)s&lt;/p&gt;</summary>
+        <link href="http://example.com/entries/%(i)s"/>
+        <id>http://example.com/entries/%(i)s</id>
+        <updated>2017-01-26T13:51:01Z</updated>
+%(media)s    </entry>
+"""
+GENERATED_MEDIA = """            <media:thumbnail width="976" height="549" url="http://example.com/images/%(i)s.jpg"/>
+"""
+
+
+def generate_items(template, count, media):
+    return "".join(
+        template % {"i": i, "media": GENERATED_MEDIA % {"i": i} if media
+                    else ""}
+        for i in range(count)
+    )
+
+
+def generate_rss(count, media=False):
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/">
+    <channel>
+        <title>Generated feed</title>
+        <description>Generated feed with %s items</description>
+        <link>http://example.com/</link>
+%s    </channel>
+</rss>""" % (count, generate_items(GENERATED_ITEM, count, media))
+
+
+def generate_atom(count, media=False):
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:media="http://search.yahoo.com/mrss/">
+    <title>Generated feed</title>
+    <subtitle>Generated feed with %s entries</subtitle>
+    <link href="http://example.com/"/>
+    <id>http://example.com/</id>
+    <updated>2017-01-26T14:29:59Z</updated>
+%s</feed>""" % (count, generate_items(GENERATED_ENTRY, count, media))
+
+
+GENERATORS = {"rss": generate_rss, "atom": generate_atom}
+
+
+def gzip_body(body):
+    out = BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb") as f:
+        f.write(body)
+    return out.getvalue()
+
+
 class Handler(SimpleHTTPRequestHandler):
-    # Local server to return the RSS Feed.
-    def set_header(self):
-        self.send_response(200)
+    # Local server to return the RSS Feed. Connections are kept alive so
+    # clients can reuse them.
+    protocol_version = "HTTP/1.1"
+
+    def set_header(self, status=200, etag=TEST_ETAG, length=0,
+                   encoding=None):
+        self.send_response(status)
         self.send_header("Content-type", "application/rss+xml")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(length))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
         self.end_headers()
 
+    def get_body(self):
+        match = GENERATED_PATH.match(self.path)
+        if match:
+            generate = GENERATORS[match.group(1)]
+            return generate(int(match.group(2)), bool(match.group(3)))
+        return TEST_RSS
+
     def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/test/feed")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.get_body()
+        etag = get_etag(body)
+        # Honour conditional requests so pollers can be tested against 304s.
+        if self.headers.get("If-None-Match") == etag:
+            self.set_header(304, etag)
+            return
+        encoding = None
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip_body(body)
+            encoding = "gzip"
         # Construct the response.
-        self.wfile.write(TEST_RSS)
+        self.set_header(etag=etag, length=len(body), encoding=encoding)
+        self.wfile.write(body)
         return
 
+    def log_message(self, format, *args):
+        # Tests fetch the feeds many times, keep their output readable
+        pass
 
-class TestServer(SocketServer.TCPServer):
+
+class TestServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
     allow_reuse_address = True
+    daemon_threads = True
+    # Connections accepted, to tell whether clients reuse them
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        SocketServer.ThreadingMixIn.process_request(
+            self, request, client_address
+        )
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading a feed early close the connection
+        # while it is still being written.
+        if isinstance(sys.exc_info()[1], socket.error):
+            return
+        SocketServer.TCPServer.handle_error(self, request, client_address)
 
 
 test_server = TestServer(('', PORT), Handler)
 
 
-def server_setup():
-    # Start the server that returns the RSS feed.
-    thread = threading.Thread(target=test_server.serve_forever)
+def start_server(server):
+    thread = threading.Thread(target=server.serve_forever)
     thread.daemon = True
     thread.start()
+    return server
+
+
+def server_setup():
+    # Start the server that returns the RSS feed.
+    start_server(test_server)
+
+
+def extra_server_setup(port):
+    # Start another instance of the server, to fetch from several hosts.
+    return start_server(TestServer(('', port), Handler))
 
 
 def server_teardown():
-    # Stop server which returned test rss data.
+    # Stop server which returned test rss data, and close the connections
+    # kept alive to it.
     test_server.shutdown()
+    from rssfeed.fetch import get_fetcher
+    get_fetcher().connections.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.test.client import Client
+from django.utils import timezone
+from mock import patch
+
+from rssfeed.models import Feed
 
 
 class AdminTestCase(TestCase):
@@ -38,5 +42,22 @@ class AdminTestCase(TestCase):
         response = self.client.get("/admin/rssfeed/feed/add/")
         self.assertEqual(response.status_code, 200)
 
+    def test_enable_feeds(self):
+        with patch("rssfeed.tasks.poll_feed.delay"):
+            feed = Feed.objects.create(url="http://example.com/feed")
+        Feed.objects.filter(pk=feed.pk).update(
+            disabled=True, consecutive_failures=10,
+            next_poll_at=timezone.now()
+        )
+        response = self.client.get("/admin/rssfeed/feed/?disabled__exact=1")
+        self.assertContains(response, "http://example.com/feed")
+        self.client.post("/admin/rssfeed/feed/", {
+            "action": "enable_feeds", "_selected_action": [feed.pk]
+        })
+        feed = Feed.objects.get(pk=feed.pk)
+        self.assertFalse(feed.disabled)
+        self.assertEqual(feed.consecutive_failures, 0)
+        self.assertIsNone(feed.next_poll_at)
+
     def tearDown(self):
         pass
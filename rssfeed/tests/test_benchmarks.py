@@ -0,0 +1,51 @@
+from django.test import TestCase
+from mock import patch
+
+from rssfeed.models import Feed
+from rssfeed.tests.benchmarks import (
+    benchmark_feed, benchmark_images, benchmark_text, measure
+)
+from rssfeed.tests.simple_test_server import (
+    PORT, server_setup, server_teardown
+)
+
+
+def setUpModule():
+    server_setup()
+
+
+def tearDownModule():
+    server_teardown()
+
+
+class BenchmarkTest(TestCase):
+    # Keep the benchmarks runnable as the pipeline changes.
+
+    def test_benchmark_feed(self):
+        url = "http://localhost:%s/generated/atom/30/media" % PORT
+        measurements = benchmark_feed(url, "atom 30 media", 1)
+        stages = [measurement.stage for measurement in measurements]
+        self.assertIn("poll_feed", stages)
+        self.assertIn("render_rssfeed", stages)
+        self.assertFalse(Feed.objects.filter(url=url).exists())
+
+    def test_benchmark_images(self):
+        measurements = benchmark_images(1, count=10)
+        stages = set(measurement.stage for measurement in measurements)
+        self.assertEqual(stages, {"legacy_find_image/10", "find_image/10"})
+
+    def test_benchmark_text(self):
+        measurements = benchmark_text(1, count=10)
+        stages = set(measurement.stage for measurement in measurements)
+        self.assertEqual(
+            stages, {"beautifulsoup_to_text/10", "html_to_text/10"}
+        )
+
+    @patch("rssfeed.tests.benchmarks.tracemalloc", None)
+    def test_peak_memory_per_stage(self):
+        # Without tracemalloc the peak of each stage is its own, not that of
+        # the process
+        _, large = measure("large", "", lambda: len(b"x" * 50 * 1024 * 1024))
+        _, small = measure("small", "", lambda: len(b"x" * 1024))
+        self.assertGreater(large.peak, 40 * 1024)
+        self.assertLess(small.peak, 10 * 1024)
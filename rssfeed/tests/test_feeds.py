@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+from mock import patch
+
+from rssfeed.caching import bump_entries_version
+from rssfeed.models import Entry, Feed
+
+
+class EntriesFeedTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.patcher.start()
+        self.feeds = [
+            Feed.objects.create(
+                url="http://example.com/%s" % i, title="Feed %s" % i
+            )
+            for i in range(2)
+        ]
+        now = timezone.now()
+        for i in range(4):
+            Entry.objects.create(
+                feed=self.feeds[i % 2],
+                title="Entry %s" % i,
+                link="http://example.com/entries/%s" % i,
+                description="Description %s" % i,
+                published=now - timedelta(hours=i)
+            )
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_rss(self):
+        response = self.client.get(reverse("rssfeed_entries_rss"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("application/rss+xml", response["Content-Type"])
+        for i in range(4):
+            self.assertContains(response, "<title>Entry %s</title>" % i)
+        self.assertTrue(response.has_header("ETag"))
+        self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_feed_atom(self):
+        response = self.client.get(reverse(
+            "rssfeed_feed_entries_atom", args=[self.feeds[1].pk]
+        ))
+        self.assertIn("application/atom+xml", response["Content-Type"])
+        self.assertContains(response, "<title>Feed 1</title>")
+        self.assertContains(response, "Entry 1")
+        self.assertNotContains(response, "Entry 0")
+
+    def test_missing_feed(self):
+        response = self.client.get(
+            reverse("rssfeed_feed_entries_rss", args=[0])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified(self):
+        url = reverse("rssfeed_entries_rss")
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+    def test_stored_late(self):
+        url = reverse("rssfeed_entries_rss")
+        self.client.get(url)
+        Entry.objects.create(
+            feed=self.feeds[0], title="Entry late",
+            link="http://example.com/entries/late",
+            published=timezone.now() - timedelta(days=1)
+        )
+        bump_entries_version()
+        # Readers sending only If-Modified-Since see entries stored with an
+        # older published date
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=timezone.now().strftime(
+                "%a, %d %b %Y %H:%M:%S GMT"
+            )
+        )
+        self.assertContains(response, "Entry late")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes(self):
+        url = reverse("rssfeed_feed_entries_rss", args=[self.feeds[0].pk])
+        etag = self.client.get(url)["ETag"]
+        # Entries stored with an old published date change the ETag
+        bump_entries_version()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        atom_url = reverse(
+            "rssfeed_feed_entries_atom", args=[self.feeds[0].pk]
+        )
+        self.assertNotEqual(self.client.get(atom_url)["ETag"], etag)
@@ -0,0 +1,246 @@
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+import feedparser
+from django.test import TestCase
+from django.test import override_settings
+from mock import patch
+
+from rssfeed.fetch import (
+    ConnectionPool, FetchError, Fetcher, fetch, read_body
+)
+from rssfeed.models import Entry, Feed
+from rssfeed.tasks import poll_feed_batch
+from rssfeed.tests.simple_test_server import (
+    PORT, TEST_ETAG, TEST_RSS, extra_server_setup, generate_rss,
+    server_setup, server_teardown, test_server
+)
+
+EXTRA_PORTS = [PORT + 1, PORT + 2]
+extra_servers = []
+
+
+def setUpModule():
+    server_setup()
+    for port in EXTRA_PORTS:
+        extra_servers.append(extra_server_setup(port))
+
+
+def tearDownModule():
+    server_teardown()
+    while extra_servers:
+        extra_servers.pop().shutdown()
+
+
+class FetchTest(TestCase):
+
+    def test_fetch(self):
+        result = fetch("http://localhost:%s/test/feed" % PORT)
+        self.assertEqual(result.status, 200)
+        self.assertEqual(result.body, TEST_RSS)
+        self.assertEqual(result.etag, TEST_ETAG)
+        self.assertIsNone(result.error)
+
+    def test_not_modified(self):
+        result = fetch("http://localhost:%s/test/feed" % PORT, TEST_ETAG)
+        self.assertTrue(result.not_modified)
+        self.assertIsNone(result.body)
+
+    def test_connection_error(self):
+        result = fetch("http://localhost:1/test/feed", timeout=1)
+        self.assertIsNone(result.status)
+        self.assertTrue(result.error)
+
+    def test_fetch_many(self):
+        fetcher = Fetcher(workers=4)
+        urls = [
+            "http://localhost:%s/test/feed/%s" % (port, i)
+            for port in [PORT] + EXTRA_PORTS for i in range(3)
+        ]
+        results = fetcher.fetch_many([(url, None, None) for url in urls])
+        fetcher.close()
+        self.assertEqual([result.url for result in results], urls)
+        self.assertEqual(
+            set(result.body for result in results), set([TEST_RSS])
+        )
+
+    def test_per_host_limit(self):
+        in_flight = {}
+        peak = {}
+        lock = threading.Lock()
+
+        def slow_fetch(url, etag, modified, timeout, max_items, connections):
+            host = url.split("/")[2]
+            with lock:
+                in_flight[host] = in_flight.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), in_flight[host])
+            time.sleep(0.05)
+            with lock:
+                in_flight[host] -= 1
+
+        fetcher = Fetcher(workers=8, per_host=2)
+        with patch("rssfeed.fetch.fetch", slow_fetch):
+            fetcher.fetch_many(
+                [("http://a.example.com/%s" % i, None, None)
+                 for i in range(6)] +
+                [("http://b.example.com/%s" % i, None, None)
+                 for i in range(6)]
+            )
+        fetcher.close()
+        self.assertEqual(peak, {"a.example.com": 2, "b.example.com": 2})
+
+    def test_per_host_rate(self):
+        starts = {}
+        lock = threading.Lock()
+
+        def record_fetch(url, *args):
+            with lock:
+                starts.setdefault(url.split("/")[2], []).append(time.time())
+
+        fetcher = Fetcher(workers=8, per_host=4, per_host_rate=20)
+        with patch("rssfeed.fetch.fetch", record_fetch):
+            fetcher.fetch_many(
+                [("http://a.example.com/%s" % i, None, None)
+                 for i in range(5)] +
+                [("http://b.example.com/%s" % i, None, None)
+                 for i in range(5)]
+            )
+        fetcher.close()
+        for host_starts in starts.values():
+            host_starts.sort()
+            # Five requests at 20 a second take at least 0.2 seconds
+            self.assertGreaterEqual(
+                host_starts[-1] - host_starts[0], 0.19
+            )
+        self.assertLess(max(starts["a.example.com"]) - min(
+            starts["b.example.com"]), 0.3)
+
+    def test_connection_reuse(self):
+        connections = ConnectionPool()
+        url = "http://localhost:%s/test/feed" % PORT
+        accepted = test_server.connections
+        for i in range(3):
+            result = fetch(url, connections=connections)
+            self.assertEqual(result.body, TEST_RSS)
+        self.assertEqual(test_server.connections, accepted + 1)
+        # A connection the server has closed is replaced
+        for conns in connections.idle.values():
+            conns[0].sock.close()
+        self.assertEqual(fetch(url, connections=connections).body, TEST_RSS)
+        connections.close()
+
+    def test_truncated_fetch(self):
+        # A connection is only reused once its response was read to the end
+        connections = ConnectionPool()
+        result = fetch(
+            "http://localhost:%s/generated/rss/1000" % PORT, max_items=5,
+            connections=connections
+        )
+        self.assertTrue(result.truncated)
+        result = fetch(
+            "http://localhost:%s/test/feed" % PORT, connections=connections
+        )
+        self.assertEqual(result.body, TEST_RSS)
+        connections.close()
+
+    def test_redirect(self):
+        result = fetch("http://localhost:%s/redirect" % PORT)
+        self.assertEqual(result.url, "http://localhost:%s/test/feed" % PORT)
+        self.assertEqual(result.body, TEST_RSS)
+
+    def test_gzip(self):
+        # The test server compresses responses for clients accepting gzip
+        result = fetch("http://localhost:%s/generated/rss/50" % PORT)
+        self.assertEqual(result.body, generate_rss(50))
+        self.assertNotIn("content-encoding", result.headers)
+
+
+class StreamingFetchTest(TestCase):
+
+    def test_stop_after_max_items(self):
+        result = fetch(
+            "http://localhost:%s/generated/rss/1000" % PORT, max_items=5
+        )
+        self.assertTrue(result.truncated)
+        self.assertTrue(len(result.body) < len(generate_rss(1000)))
+        parsed = feedparser.parse(result.body)
+        self.assertFalse(parsed.bozo)
+        self.assertEqual(len(parsed.entries), 5)
+        self.assertEqual(parsed.feed.title, "Generated feed")
+
+    def test_small_feed_untouched(self):
+        result = fetch(
+            "http://localhost:%s/generated/rss/3" % PORT, max_items=5
+        )
+        self.assertFalse(result.truncated)
+        self.assertEqual(result.body, generate_rss(3))
+
+    def test_tag_split_between_chunks(self):
+        body = generate_rss(50)
+        with patch("rssfeed.fetch.CHUNK_SIZE", 7):
+            truncated, _ = read_body(BytesIO(body), len(body), max_items=10)
+        self.assertEqual(len(feedparser.parse(truncated).entries), 10)
+
+    @override_settings(RSSFEED_FETCH_MAX_BYTES=4096)
+    def test_max_bytes(self):
+        result = fetch("http://localhost:%s/generated/rss/1000" % PORT)
+        self.assertTrue(result.truncated)
+        self.assertTrue(len(result.body) < 4096 + 16 * 1024)
+        parsed = feedparser.parse(result.body)
+        self.assertFalse(parsed.bozo)
+        self.assertTrue(len(parsed.entries) > 0)
+
+    def test_max_bytes_without_items(self):
+        body = b"<rss><channel>" + b"x" * 100
+        with patch("rssfeed.fetch.CHUNK_SIZE", 10):
+            self.assertRaises(FetchError, read_body, BytesIO(body), 50)
+
+
+class PollFeedBatchTest(TestCase):
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feeds = [
+            Feed.objects.create(url="http://localhost:%s/test/feed" % port)
+            for port in [PORT] + EXTRA_PORTS
+        ]
+        self.broken = Feed.objects.create(url="http://localhost:1/feed")
+
+    # Every test server serves the same entries
+    @override_settings(RSSFEED_DEDUPE_ACROSS_FEEDS=False)
+    def test_poll_feed_batch(self):
+        poll_feed_batch(
+            [feed.pk for feed in self.feeds] + [self.broken.pk]
+        )
+        for feed in self.feeds:
+            self.assertEqual(Entry.objects.filter(feed=feed).count(), 2)
+            self.assertEqual(
+                Feed.objects.get(pk=feed.pk).title, "BBC News - Home"
+            )
+        # The broken feed is backed off without failing the batch
+        self.assertIsNotNone(Feed.objects.get(pk=self.broken.pk).next_poll_at)
+
+    def test_non_ascii_url(self):
+        # A failing feed reported on an ASCII stdout
+        broken = Feed.objects.create(url=u"http://localhost:1/actualit\xe9s")
+        for verbose in [False, True]:
+            with patch("sys.stdout", tempfile.TemporaryFile()):
+                poll_feed_batch([broken.pk, self.feeds[0].pk], verbose)
+            self.assertEqual(
+                Entry.objects.filter(feed=self.feeds[0]).count(), 2
+            )
+            self.assertEqual(
+                Feed.objects.get(pk=broken.pk).consecutive_failures,
+                verbose + 1
+            )
+            Entry.objects.all().delete()
+            Feed.objects.filter(pk=self.feeds[0].pk).update(
+                body_digest=None, entries_digest=None, etag=None,
+                newest_entry_hash=None
+            )
+
+    def tearDown(self):
+        self.patcher.stop()
@@ -0,0 +1,178 @@
+from importlib import import_module
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test import override_settings
+from mock import patch
+
+from rssfeed.identity import canonicalize_url
+from rssfeed.models import Entry, Feed, make_link_hash
+from rssfeed.tasks import parse_entries, parse_feed
+
+RSS = """<?xml version="1.0"?>
+<rss version="2.0">
+<channel>
+<title>Test</title>
+<link>http://example.com/</link>
+%s
+</channel>
+</rss>"""
+
+ITEM = """<item>
+<title>%s</title>
+<link>%s</link>
+<guid isPermaLink="false">%s</guid>
+</item>"""
+
+
+def parse(*items):
+    return parse_feed(
+        RSS % "".join(ITEM % item for item in items)
+    )["entries"]
+
+
+class CanonicalizeUrlTest(TestCase):
+
+    def test_canonical(self):
+        for url in [
+            "http://example.com/news/1",
+            " https://EXAMPLE.com./news/1 ",
+            "http://example.com:80/news/1#comments",
+            "https://example.com:443/news/1?utm_source=rss&utm_medium=feed",
+            "http://example.com/news/1?at_medium=RSS&AT_campaign=KARANGA",
+        ]:
+            self.assertEqual(
+                canonicalize_url(url), "https://example.com/news/1", url
+            )
+
+    def test_query_kept(self):
+        self.assertEqual(
+            canonicalize_url("http://example.com/?id=1&utm_source=x&q=a+b"),
+            "https://example.com/?id=1&q=a+b"
+        )
+        self.assertEqual(
+            canonicalize_url("http://example.com:8080"),
+            "https://example.com:8080/"
+        )
+
+    @override_settings(RSSFEED_TRACKING_PARAMS=["id"])
+    def test_tracking_params_setting(self):
+        self.assertEqual(
+            canonicalize_url("http://example.com/?id=1&utm_source=x"),
+            "https://example.com/?utm_source=x"
+        )
+
+    def test_not_http(self):
+        for url in ["test_entry_link", "urn:uuid:1234", "ftp://a.com/#b"]:
+            self.assertEqual(canonicalize_url(" %s" % url), url)
+
+    def test_link_hash(self):
+        self.assertEqual(
+            make_link_hash("http://example.com/a?utm_source=rss"),
+            make_link_hash("https://example.com/a")
+        )
+
+    def test_migration_link_hash(self):
+        # The migration has its own copy, matching the default settings
+        migration = import_module(
+            "rssfeed.migrations.0013_rehash_entry_links"
+        )
+        for url in [
+            "http://EXAMPLE.com:80/a?utm_source=rss&id=1#c",
+            "https://user@example.com:8080/b?at_medium=RSS",
+            " test_entry_link ",
+        ]:
+            self.assertEqual(
+                migration.make_link_hash(url), make_link_hash(url)
+            )
+
+
+@override_settings(RSSFEED_SEEN_ENTRIES_SIZE=200)
+class DeduplicationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.patcher.start()
+        self.feeds = [
+            Feed.objects.create(url="http://example.com/%s" % i)
+            for i in range(2)
+        ]
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_canonical_links(self):
+        parse_entries(parse(
+            ("One", "http://example.com/1?at_medium=RSS", "1"),
+            ("One again", "https://example.com/1", "2"),
+        ), self.feeds[0], False)
+        self.assertEqual(
+            list(Entry.objects.values_list("title", "link")),
+            [("One", "http://example.com/1?at_medium=RSS")]
+        )
+
+    def test_guid(self):
+        parse_entries(parse(
+            ("One", "http://example.com/1", "1"),
+        ), self.feeds[0], False)
+        cache.clear()
+        # The link changed, the guid did not
+        created = parse_entries(parse(
+            ("One", "http://example.com/one", "1"),
+            ("Two", "http://example.com/2", "2"),
+        ), self.feeds[0], False)
+        self.assertEqual([entry.title for entry in created], ["Two"])
+        # Guids only identify entries within their feed
+        created = parse_entries(parse(
+            ("Other", "http://example.com/other", "1"),
+        ), self.feeds[1], False)
+        self.assertEqual(len(created), 1)
+
+    def test_across_feeds(self):
+        items = [("One", "http://example.com/1", "1")]
+        parse_entries(parse(*items), self.feeds[0], False)
+        created = parse_entries(parse(*items), self.feeds[1], False)
+        self.assertEqual(created, [])
+        cache.clear()
+        with override_settings(RSSFEED_DEDUPE_ACROSS_FEEDS=False):
+            created = parse_entries(parse(*items), self.feeds[1], False)
+        self.assertEqual(len(created), 1)
+
+    def test_guid_reused_by_other_feed(self):
+        parse_entries(parse(
+            ("One", "http://a.com/1", "1"),
+        ), self.feeds[0], False)
+        created = parse_entries(parse(
+            ("Own", "http://b.com/99", "1"),
+            ("Copy", "http://a.com/1", "7"),
+        ), self.feeds[1], False)
+        # Only the copy is skipped, the guid of the other feed is unrelated
+        self.assertEqual([entry.title for entry in created], ["Own"])
+
+    def test_seen_entries(self):
+        items = [
+            ("One", "http://example.com/1", "1"),
+            ("Two", "http://example.com/2", "2"),
+        ]
+        parse_entries(parse(*items), self.feeds[0], False)
+        # Entries seen in the last poll are skipped without a query
+        with self.assertNumQueries(0):
+            created = parse_entries(parse(*items), self.feeds[0], False)
+        self.assertEqual(created, [])
+        # Only the new entry is looked up
+        items.append(("Three", "http://example.com/3", "3"))
+        with self.assertNumQueries(4):
+            created = parse_entries(parse(*items), self.feeds[0], False)
+        self.assertEqual([entry.title for entry in created], ["Three"])
+
+    @override_settings(RSSFEED_SEEN_ENTRIES_SIZE=2)
+    def test_seen_entries_size(self):
+        items = [("One", "http://example.com/1", "1")]
+        parse_entries(parse(*items), self.feeds[0], False)
+        parse_entries(parse(
+            ("Two", "http://example.com/2", "2"),
+        ), self.feeds[0], False)
+        # The identities of the first entry were forgotten
+        with self.assertNumQueries(1):
+            parse_entries(parse(*items), self.feeds[0], False)
@@ -0,0 +1,136 @@
+import time
+
+import feedparser
+from django.test import TestCase
+
+from rssfeed.images import (
+    find_enclosure_image, find_summary_image, get_entry_image, is_image_url
+)
+from rssfeed.tasks import get_entry_attrs
+
+ENCLOSURE_RSS = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+    <channel>
+        <title>Enclosures</title>
+        <item>
+            <title>Enclosure</title>
+            <description><![CDATA[
+                <img src="http://example.com/summary.jpg">
+            ]]></description>
+            <enclosure url="http://example.com/a.mp3" type="audio/mpeg"
+                length="1"/>
+            <enclosure url="http://example.com/enclosure.jpg"
+                type="image/jpeg" length="1"/>
+        </item>
+        <item>
+            <title>Summary</title>
+            <description><![CDATA[
+                <p><img src="http://example.com/summary.jpg"></p>
+            ]]></description>
+        </item>
+        <item>
+            <title>No image</title>
+            <description>Released on http://example.com/a.jpg</description>
+        </item>
+    </channel>
+</rss>"""
+
+
+class ImageTest(TestCase):
+
+    def test_is_image_url(self):
+        self.assertTrue(is_image_url("http://example.com/a.JPG"))
+        self.assertTrue(is_image_url("https://example.com/a.png?w=100"))
+        self.assertTrue(is_image_url("//example.com/a.webp"))
+        self.assertTrue(is_image_url("http://example.com/a", "image/jpeg"))
+        self.assertFalse(is_image_url("http://example.com/a.mp3"))
+        self.assertFalse(is_image_url("http://example.com/a.jpg", "audio/mp3"))
+        self.assertFalse(is_image_url("/relative/a.jpg"))
+        self.assertFalse(is_image_url("data:image/png;base64,AAAA"))
+        self.assertFalse(is_image_url("http://example.com/%s.jpg" % (
+            "a" * 2000)))
+
+    def test_summary_image(self):
+        summary = (
+            '<p>Read <a href="http://example.com/story.html">more</a></p>'
+            '<img width="1" src="http://example.com/pixel.gif?id=1&amp;x=2">'
+            '<IMG alt="b" SRC=\'http://example.com/b.png\'>'
+        )
+        self.assertEqual(
+            find_summary_image(summary),
+            "http://example.com/pixel.gif?id=1&x=2"
+        )
+        self.assertEqual(
+            find_summary_image(
+                '<img src="http://example.com/a.html">'
+                '<IMG alt="b" SRC=\'http://example.com/b.png\'>'
+            ),
+            "http://example.com/b.png"
+        )
+        self.assertEqual(
+            find_summary_image("<img src=http://example.com/c.jpeg />"),
+            "http://example.com/c.jpeg"
+        )
+
+    def test_summary_without_image(self):
+        # The extensions alone, outside an <img> tag, are not images
+        self.assertEqual(find_summary_image(""), "")
+        self.assertEqual(find_summary_image(None), "")
+        self.assertEqual(
+            find_summary_image("See http://example.com/a.jpg for a png"), ""
+        )
+        self.assertEqual(
+            find_summary_image('<img src="http://example.com/a.svgz">'), ""
+        )
+        self.assertEqual(find_summary_image("<img " * 1000), "")
+
+    def test_summary_scanned_once(self):
+        # Unclosed tags, or many tags before the first ">", do not make the
+        # search quadratic
+        start = time.time()
+        for summary in [
+            "<img " * 100000,
+            "<img " * 100000 + ">",
+            "<img src=" * 100000 + ">",
+            '<img alt="' + "a" * 500000 + '">' * 100000,
+        ]:
+            self.assertEqual(find_summary_image(summary), "")
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(
+            find_summary_image(
+                "<img " * 100000 + '<img src="http://example.com/a.jpg">'
+            ),
+            "http://example.com/a.jpg"
+        )
+
+    def test_enclosure_image(self):
+        enclosures = [
+            {"href": "http://example.com/a.mp3", "type": "audio/mpeg"},
+            {"href": "http://example.com/image", "type": "image/jpeg"},
+        ]
+        self.assertEqual(
+            find_enclosure_image(enclosures), "http://example.com/image"
+        )
+        self.assertEqual(
+            find_enclosure_image([{"href": "http://example.com/a.png"}]),
+            "http://example.com/a.png"
+        )
+        self.assertEqual(find_enclosure_image(None), "")
+
+    def test_entry_image(self):
+        parsed = feedparser.parse(ENCLOSURE_RSS)
+        self.assertEqual(
+            get_entry_image(parsed.entries[0]),
+            "http://example.com/enclosure.jpg"
+        )
+        self.assertEqual(
+            get_entry_image(parsed.entries[1]),
+            "http://example.com/summary.jpg"
+        )
+        self.assertEqual(
+            get_entry_attrs(parsed.entries[1], False)["image"],
+            "http://example.com/summary.jpg"
+        )
+        self.assertEqual(
+            get_entry_attrs(parsed.entries[2], False)["image"], ""
+        )
@@ -0,0 +1,137 @@
+import os
+import shutil
+import socket
+import tempfile
+
+from django.test import TestCase
+from django.test import override_settings
+from mock import patch
+
+from rssfeed import metrics, tasks
+from rssfeed.metrics import PrometheusBackend, StatsdBackend
+from rssfeed.models import Feed
+from rssfeed.fetch import FetchResult
+from rssfeed.tasks import parse_many, poll_feed
+from rssfeed.tests.simple_test_server import (
+    PORT, TEST_RSS, server_setup, server_teardown
+)
+
+
+def setUpModule():
+    server_setup()
+
+
+def tearDownModule():
+    server_teardown()
+
+
+class PrometheusBackendTest(TestCase):
+
+    def test_render(self):
+        backend = PrometheusBackend()
+        backend.incr("polls", tags={"outcome": "updated", "feed": 1})
+        backend.incr("polls", 2, tags={"outcome": "updated", "feed": 1})
+        backend.timing("fetch", 0.5, tags={"feed": 1})
+        backend.timing("fetch", 0.25, tags={"feed": 1})
+        self.assertEqual(
+            backend.render(),
+            "# TYPE rssfeed_polls_total counter\n"
+            'rssfeed_polls_total{feed="1",outcome="updated"} 3\n'
+            "# TYPE rssfeed_fetch_seconds summary\n"
+            'rssfeed_fetch_seconds_count{feed="1"} 2\n'
+            'rssfeed_fetch_seconds_sum{feed="1"} 0.75\n'
+        )
+
+    def test_textfile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            backend = PrometheusBackend(
+                textfile=os.path.join(directory, "rssfeed.prom")
+            )
+            backend.incr("polls")
+            backend.flush()
+            # Each process writes its own file, the counters of worker
+            # processes would otherwise overwrite each other
+            path = os.path.join(directory, "rssfeed.%s.prom" % os.getpid())
+            with open(path) as f:
+                self.assertEqual(
+                    f.read(),
+                    "# TYPE rssfeed_polls_total counter\n"
+                    'rssfeed_polls_total{pid="%s"} 1\n' % os.getpid()
+                )
+            self.assertEqual(os.listdir(directory), [os.path.basename(path)])
+        finally:
+            shutil.rmtree(directory)
+
+
+class StatsdBackendTest(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.settimeout(1)
+
+    def test_send(self):
+        backend = StatsdBackend(port=self.server.getsockname()[1], tags=True)
+        backend.incr("polls", tags={"outcome": "updated"})
+        self.assertEqual(
+            self.server.recv(1024), b"rssfeed.polls:1|c|#outcome:updated"
+        )
+        backend.timing("fetch", 0.1234)
+        self.assertEqual(self.server.recv(1024), b"rssfeed.fetch:123|ms")
+
+    def tearDown(self):
+        self.server.close()
+
+
+@override_settings(
+    RSSFEED_METRICS_BACKEND="rssfeed.metrics.PrometheusBackend"
+)
+class PollMetricsTest(TestCase):
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feed = Feed.objects.create(
+            url="http://localhost:%s/test/feed" % PORT
+        )
+        # Every test counts from zero
+        metrics.reset_backend(setting="RSSFEED_METRICS_BACKEND")
+
+    def test_poll_metrics(self):
+        poll_feed(self.feed.pk)
+        poll_feed(self.feed.pk)
+        backend = metrics.get_backend()
+        tags = (("feed", self.feed.pk),)
+        self.assertEqual(
+            backend.counters[("polls", (("feed", self.feed.pk),
+                                        ("outcome", "updated")))], 1
+        )
+        self.assertEqual(
+            backend.counters[("polls", (("feed", self.feed.pk),
+                                        ("outcome", "not_modified")))], 1
+        )
+        self.assertEqual(backend.counters[("entries_created", ())], 2)
+        self.assertTrue(backend.counters[("queries", tags)] > 0)
+        self.assertEqual(backend.summaries[("fetch", tags)][0], 2)
+        self.assertEqual(backend.summaries[("write", tags)][0], 2)
+        self.assertEqual(backend.summaries[("parse", ())][0], 1)
+        self.assertEqual(backend.summaries[("strip_html", ())][0], 3)
+
+    @override_settings(RSSFEED_PARSE_PROCESSES=2)
+    def test_parse_process_metrics(self):
+        try:
+            parse_many([
+                FetchResult("http://example.com/feed", status=200,
+                            body=TEST_RSS)
+            ])
+        finally:
+            tasks.get_parse_pool().terminate()
+            tasks._parse_pool = None
+        # Reported by the parse process, returned to this one
+        backend = metrics.get_backend()
+        self.assertEqual(backend.summaries[("parse", ())][0], 1)
+        self.assertEqual(backend.summaries[("strip_html", ())][0], 3)
+
+    def tearDown(self):
+        self.patcher.stop()
@@ -27,6 +27,15 @@ class FeedTest(TestCase):
         self.feed.title = "Test Feed"
         self.feed.save()
 
+    def test_new_feed_polled(self):
+        self.mock_delay.assert_called_once_with(self.feed.pk)
+
+    def test_save_existing(self):
+        # Saving an existing feed neither looks it up again nor polls it
+        with self.assertNumQueries(1):
+            self.feed.save()
+        self.assertEqual(self.mock_delay.call_count, 1)
+
     def test_feed_unicode(self):
         # Retrieve Feed object's unicode string.
         feed_unicode = self.feed.__unicode__()
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+from mock import patch
+
+from rssfeed.caching import get_entries_version
+from rssfeed.models import Entry, Feed
+from rssfeed.retention import get_retained, prune_entries
+from rssfeed.tasks import prune_entries as prune_entries_task
+
+
+class RetentionTest(TestCase):
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.patcher.start()
+        self.feeds = [
+            Feed.objects.create(url="http://example.com/%s" % i)
+            for i in range(2)
+        ]
+        now = timezone.now()
+        # Five entries a day apart in each feed, the last two published at
+        # the same time
+        for feed in self.feeds:
+            for i in range(5):
+                Entry.objects.create(
+                    feed=feed,
+                    title="Entry %s" % i,
+                    link="%s/entries/%s" % (feed.url, i),
+                    published=now - timedelta(days=min(i, 3))
+                )
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def get_titles(self, feed):
+        return list(
+            Entry.objects.filter(feed=feed).order_by(
+                "-published", "-id"
+            ).values_list("title", flat=True)
+        )
+
+    def test_nothing_to_prune(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(prune_entries(), 0)
+        self.assertEqual(Entry.objects.count(), 10)
+
+    def test_max_age(self):
+        version = get_entries_version()
+        deleted = prune_entries(max_age=36 * 60 * 60, batch_size=3)
+        self.assertEqual(deleted, 6)
+        for feed in self.feeds:
+            self.assertEqual(self.get_titles(feed), ["Entry 0", "Entry 1"])
+        self.assertNotEqual(get_entries_version(), version)
+
+    def test_max_per_feed(self):
+        # Entries 3 and 4 tie on published, the later id is kept
+        self.assertEqual(prune_entries(max_per_feed=4, batch_size=1), 2)
+        for feed in self.feeds:
+            self.assertEqual(
+                self.get_titles(feed),
+                ["Entry 0", "Entry 1", "Entry 2", "Entry 4"]
+            )
+        self.assertEqual(prune_entries(max_per_feed=4), 0)
+
+    @override_settings(RSSFEED_ENTRY_MAX_PER_FEED=1)
+    def test_task(self):
+        prune_entries_task()
+        self.assertEqual(Entry.objects.count(), 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "prune_entries", "--max-age", str(2 * 24 * 60 * 60 + 60),
+            stdout=out
+        )
+        self.assertIn("Deleted 4 entries", out.getvalue())
+
+    @override_settings(
+        RSSFEED_ENTRY_MAX_AGE=24 * 60 * 60, RSSFEED_ENTRY_MAX_PER_FEED=2
+    )
+    def test_retained(self):
+        now = datetime.now()
+        entries = [
+            {"link_hash": "a", "published": now - timedelta(days=2)},
+            {"link_hash": "b", "published": now},
+            {"link_hash": "c"},
+            {"link_hash": "d", "published": now - timedelta(hours=1)},
+        ]
+        # Entries without a published date are stored as published now
+        self.assertEqual(
+            [attrs["link_hash"] for attrs in get_retained(entries)],
+            ["c", "b"]
+        )
@@ -0,0 +1,185 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+from mock import MagicMock, patch
+
+from rssfeed.fetch import FetchError
+from rssfeed.models import Feed
+from rssfeed.scheduling import (
+    claim_due_feeds, get_hint_interval, schedule_failure, schedule_next_poll
+)
+from rssfeed.tasks import MalformedFeedError, poll_feed, poll_feeds
+from rssfeed.tests.simple_test_server import (
+    PORT, server_setup, server_teardown
+)
+
+
+def setUpModule():
+    server_setup()
+
+
+def tearDownModule():
+    server_teardown()
+
+
+@override_settings(
+    RSSFEED_MIN_POLL_INTERVAL=60,
+    RSSFEED_MAX_POLL_INTERVAL=3600,
+    RSSFEED_DEFAULT_POLL_INTERVAL=600
+)
+class SchedulingTest(TestCase):
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feed = Feed.objects.create(url="http://example.com/feed")
+
+    def test_updated_feed_polled_sooner(self):
+        schedule_next_poll(self.feed, True)
+        self.assertEqual(self.feed.poll_interval, 300)
+        self.assertTrue(self.feed.next_poll_at > timezone.now())
+
+    def test_idle_feed_polled_later(self):
+        schedule_next_poll(self.feed, False)
+        self.assertEqual(self.feed.poll_interval, 900)
+        self.feed.poll_interval = 3000
+        schedule_next_poll(self.feed, False)
+        self.assertEqual(self.feed.poll_interval, 3600)
+
+    def test_ttl_hint(self):
+        parsed = MagicMock()
+        parsed.feed.ttl = "30"
+        del parsed.feed.sy_updateperiod
+        self.assertEqual(get_hint_interval(parsed), 1800)
+        schedule_next_poll(self.feed, True, get_hint_interval(parsed))
+        self.assertEqual(self.feed.poll_interval, 1800)
+
+    def test_update_period_hint(self):
+        parsed = MagicMock()
+        del parsed.feed.ttl
+        parsed.feed.sy_updateperiod = "hourly"
+        parsed.feed.sy_updatefrequency = "2"
+        self.assertEqual(get_hint_interval(parsed), 1800)
+
+    def test_hint_capped(self):
+        parsed = MagicMock()
+        del parsed.feed.ttl
+        parsed.feed.sy_updateperiod = "yearly"
+        parsed.feed.sy_updatefrequency = "1"
+        self.assertEqual(get_hint_interval(parsed), 365 * 24 * 60 * 60)
+        # RSSFEED_MAX_POLL_INTERVAL still bounds the interval
+        schedule_next_poll(self.feed, True, get_hint_interval(parsed))
+        self.assertEqual(self.feed.poll_interval, 3600)
+
+    @override_settings(RSSFEED_MAX_FAILURE_BACKOFF=3000)
+    def test_failure_backoff(self):
+        now = timezone.now()
+        schedule_failure(self.feed, FetchError("HTTP 500"))
+        feed = Feed.objects.get(pk=self.feed.pk)
+        self.assertEqual(feed.consecutive_failures, 1)
+        self.assertEqual(feed.last_error, "HTTP 500")
+        # The interval of successful polls is kept
+        self.assertIsNone(feed.poll_interval)
+        delay = (feed.next_poll_at - now).total_seconds()
+        self.assertTrue(1200 * 0.9 <= delay <= 1200 * 1.1 + 1)
+        schedule_failure(feed, FetchError("HTTP 500"))
+        schedule_failure(feed, FetchError("HTTP 500"))
+        delay = (feed.next_poll_at - now).total_seconds()
+        self.assertTrue(3000 * 0.9 <= delay <= 3000 * 1.1 + 1)
+
+    def test_non_ascii_error(self):
+        error = MalformedFeedError(u'Malformed feed "actualit\xe9s"')
+        schedule_failure(self.feed, error)
+        self.assertEqual(
+            Feed.objects.get(pk=self.feed.pk).last_error,
+            u'Malformed feed "actualit\xe9s"'
+        )
+
+    @override_settings(RSSFEED_DISABLE_AFTER_FAILURES=2)
+    def test_disable_after_failures(self):
+        schedule_failure(self.feed, "Timed out")
+        self.assertFalse(Feed.objects.get(pk=self.feed.pk).disabled)
+        schedule_failure(self.feed, "Timed out")
+        self.assertTrue(Feed.objects.get(pk=self.feed.pk).disabled)
+        Feed.objects.filter(pk=self.feed.pk).update(next_poll_at=None)
+        self.assertEqual(claim_due_feeds(), [])
+
+    def test_success_resets_failures(self):
+        schedule_failure(self.feed, "Timed out")
+        self.feed.url = "http://localhost:%s/test/feed" % PORT
+        self.feed.save()
+        poll_feed(self.feed.pk)
+        feed = Feed.objects.get(pk=self.feed.pk)
+        self.assertEqual(feed.consecutive_failures, 0)
+        self.assertIsNone(feed.last_error)
+        self.assertIsNotNone(feed.last_success)
+
+    def test_claim_due_feeds(self):
+        later = Feed.objects.create(url="http://example.com/later")
+        Feed.objects.filter(pk=later.pk).update(
+            next_poll_at=timezone.now() + timedelta(hours=1)
+        )
+        self.assertEqual(claim_due_feeds(), [self.feed.pk])
+        # Claimed feeds are not dispatched again while queued
+        self.assertEqual(claim_due_feeds(), [])
+
+    def test_claim_only_selected(self):
+        def select(ids):
+            ids = list(ids)
+            # Becomes due after the select
+            Feed.objects.create(url="http://example.com/new")
+            return ids
+
+        with patch("rssfeed.scheduling.list", select, create=True):
+            self.assertEqual(claim_due_feeds(), [self.feed.pk])
+        # Not leased without being dispatched
+        self.assertEqual(
+            claim_due_feeds(),
+            [Feed.objects.get(url="http://example.com/new").pk]
+        )
+
+    @patch("rssfeed.scheduling.CLAIM_CHUNK_SIZE", 2)
+    def test_claim_in_chunks(self):
+        for i in range(4):
+            Feed.objects.create(url="http://example.com/%s" % i)
+        self.assertEqual(len(claim_due_feeds()), 5)
+        self.assertEqual(claim_due_feeds(), [])
+
+    def test_poll_feeds_only_due(self):
+        Feed.objects.create(url="http://example.com/later")
+        Feed.objects.exclude(pk=self.feed.pk).update(
+            next_poll_at=timezone.now() + timedelta(hours=1)
+        )
+        with patch("rssfeed.tasks.group") as group:
+            poll_feeds()
+        batches = group.call_args[0][0]
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].args, ([self.feed.pk], False))
+        group.return_value.apply_async.assert_called_once_with()
+
+    @override_settings(RSSFEED_POLL_BATCH_SIZE=2, RSSFEED_POLL_JITTER=30)
+    def test_poll_feeds_batches(self):
+        feeds = [self.feed] + [
+            Feed.objects.create(url="http://example.com/%s" % i)
+            for i in range(4)
+        ]
+        with patch("rssfeed.tasks.group") as group:
+            poll_feeds()
+        batches = group.call_args[0][0]
+        self.assertEqual(
+            sorted(pk for batch in batches for pk in batch.args[0]),
+            sorted(feed.pk for feed in feeds)
+        )
+        self.assertEqual([len(batch.args[0]) for batch in batches], [2, 2, 1])
+        for batch in batches:
+            self.assertEqual(batch.task, "rssfeed.tasks.poll_feed_batch")
+            self.assertTrue(0 <= batch.options["countdown"] <= 30)
+        # Nothing is due, nothing is published
+        with patch("rssfeed.tasks.group") as group:
+            poll_feeds()
+        self.assertFalse(group.called)
+
+    def tearDown(self):
+        self.patcher.stop()
@@ -0,0 +1,132 @@
+from django.contrib.auth import get_user_model
+from unittest import skipUnless
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from mock import patch
+
+from rssfeed.models import Entry, Feed
+from rssfeed.search import (
+    SQLITE_INSTALL, fts_tables, get_fts_query, install_search_index,
+    search_entries
+)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.patcher.start()
+        self.feed = Feed.objects.create(url="http://example.com/feed")
+        self.entries = [
+            Entry.objects.create(
+                feed=self.feed, title=title, description=description,
+                link="http://example.com/entries/%s" % i
+            )
+            for i, (title, description) in enumerate([
+                ("Prison suicides rise", "Serious attacks soar in jails"),
+                ("Economy grows", "Strong consumer spending"),
+                ("Consumer prices", None),
+            ])
+        ]
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def search(self, query):
+        return set(
+            search_entries(Entry.objects.all(), query).values_list(
+                "title", flat=True
+            )
+        )
+
+    def test_search(self):
+        self.assertEqual(self.search("consumer"), {
+            "Economy grows", "Consumer prices"
+        })
+        self.assertEqual(self.search("CONSUMER spending"), {"Economy grows"})
+        self.assertEqual(self.search("prison"), {"Prison suicides rise"})
+        self.assertEqual(self.search("missing"), set())
+        self.assertEqual(len(self.search("  ")), 3)
+
+    def test_search_syntax(self):
+        # Query syntax of the database is not interpreted
+        self.assertEqual(self.search('"economy'), {"Economy grows"})
+        self.assertEqual(self.search("grows)"), {"Economy grows"})
+        self.assertEqual(len(self.search("consumer*")), 2)
+
+    def test_index_updated(self):
+        entry = self.entries[1]
+        entry.title = "Markets fall"
+        entry.save()
+        self.assertEqual(self.search("economy"), set())
+        self.assertEqual(self.search("markets"), {"Markets fall"})
+        entry.delete()
+        self.assertEqual(self.search("markets"), set())
+
+    def test_fallback(self):
+        with patch("rssfeed.search.has_fts_table", return_value=False):
+            self.assertEqual(self.search("consumer spending"), {
+                "Economy grows"
+            })
+
+    def test_fts_table_cached(self):
+        fts_tables.clear()
+        with patch.object(
+                connection.introspection, "table_names",
+                wraps=connection.introspection.table_names) as table_names:
+            self.search("consumer")
+            self.search("economy")
+        self.assertEqual(table_names.call_count, 1)
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_sqlite_without_fts5(self):
+        statements = [
+            statement.replace("fts5(", "missing_fts5(") % {
+                "fts": "rssfeed_entry_missing"
+            }
+            for statement in SQLITE_INSTALL
+        ]
+        with patch("rssfeed.search.get_statements", return_value=statements):
+            with connection.schema_editor() as schema_editor:
+                install_search_index(None, schema_editor)
+        # No triggers are left writing to the missing table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE %s",
+                ["rssfeed_entry_missing%"]
+            )
+            self.assertEqual(cursor.fetchall(), [])
+        self.assertEqual(len(self.search("consumer")), 2)
+
+    def test_fts_query(self):
+        self.assertEqual(get_fts_query('a "b c'), '"a" """b" "c"')
+
+    def test_api(self):
+        response = self.client.get(
+            reverse("rssfeed_entry_list"), {"q": "consumer", "limit": 1}
+        )
+        data = response.json()
+        self.assertEqual(len(data["entries"]), 1)
+        response = self.client.get(data["next"])
+        self.assertEqual(len(response.json()["entries"]), 1)
+        self.assertIsNone(response.json()["next"])
+
+    def test_admin(self):
+        user = get_user_model().objects.create(
+            username="test", is_superuser=True, is_staff=True
+        )
+        user.set_password("password")
+        user.save()
+        self.client.login(username="test", password="password")
+        response = self.client.get("/admin/rssfeed/entry/", {"q": "jails"})
+        self.assertContains(response, "Prison suicides rise")
+        self.assertNotContains(response, "Economy grows")
+        # Entries are also found by their link
+        response = self.client.get(
+            "/admin/rssfeed/entry/",
+            {"q": "https://example.com/entries/1?utm_source=rss"}
+        )
+        self.assertContains(response, "Economy grows")
+        self.assertNotContains(response, "Prison suicides rise")
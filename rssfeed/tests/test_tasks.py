@@ -1,13 +1,22 @@
+import pickle
 from datetime import datetime
 
 import pytz
+from django.db import connection
 from django.test import TestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from mock import Mock, patch, MagicMock
 
-from rssfeed.models import Feed, Entry
-from rssfeed.tasks import poll_feed, MAX
-from rssfeed.tests.simple_test_server import PORT, server_setup, \
-    server_teardown
+from rssfeed import tasks
+from rssfeed.fetch import FetchResult
+from rssfeed.models import Feed, Entry, make_link_hash
+from rssfeed.tasks import (
+    create_entries, parse_entries, parse_feed, parse_many,
+    parse_result, poll_feed, update_feed, MalformedFeedError, MAX
+)
+from rssfeed.tests.simple_test_server import PORT, TEST_ETAG, TEST_RSS, \
+    server_setup, server_teardown
 
 
 def setUpModule():
@@ -66,13 +75,22 @@ class PollFeedTest(TestCase):
         poll_feed(self.feed.id, verbose=True)
 
     def test_bozo_exception(self):
-        # Test with Bozo Exception returned
+        # Test with Bozo Exception returned and no entries, a failed poll
         parser_mock = self.parser_mock
         parser_mock.return_value.feed.bozo_exception = \
             "bozo_exception returned"
+        # The mock is shared by the other tests
+        self.addCleanup(
+            parser_mock.return_value.feed.__dict__.pop, "bozo_exception"
+        )
         with patch("rssfeed.tasks.feedparser.parse", parser_mock):
             with patch("rssfeed.tasks.poll_feed.pk_feed", self.feed.id):
-                poll_feed(self.feed.id, verbose=True)
+                self.assertRaises(
+                    MalformedFeedError, poll_feed, self.feed.id, verbose=True
+                )
+        feed = Feed.objects.get(pk=self.feed.id)
+        self.assertEqual(feed.consecutive_failures, 1)
+        self.assertIn("bozo_exception returned", feed.last_error)
 
     def test_missing_attribute(self):
         # Test with missing attribute: description_detail
@@ -99,6 +117,118 @@ class PollFeedTest(TestCase):
             poll_feed(self.feed.id, verbose=True)
 
 
+class ConditionalPollFeedTest(TestCase):
+    """
+    Test that unchanged feeds are not parsed again.
+    """
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feed = Feed.objects.create(
+            url="http://localhost:%s/test/feed" % PORT
+        )
+
+    def test_validators_stored(self):
+        poll_feed(self.feed.id)
+        feed = Feed.objects.get(pk=self.feed.id)
+        self.assertEqual(feed.etag, TEST_ETAG)
+        self.assertEqual(Entry.objects.filter(feed=feed).count(), 2)
+
+    def test_not_modified(self):
+        poll_feed(self.feed.id)
+        last_polled = Feed.objects.get(pk=self.feed.id).last_polled
+        with patch("rssfeed.tasks.get_feed_attrs") as get_feed_attrs:
+            with patch("rssfeed.tasks.parse_entries") as parse_entries:
+                poll_feed(self.feed.id)
+        self.assertFalse(get_feed_attrs.called)
+        self.assertFalse(parse_entries.called)
+        self.assertEqual(
+            Feed.objects.get(pk=self.feed.id).last_polled, last_polled
+        )
+
+    def test_same_body(self):
+        # A server ignoring If-None-Match sends the same document again
+        poll_feed(self.feed.id)
+        Feed.objects.filter(pk=self.feed.id).update(etag=None)
+        feed = Feed.objects.get(pk=self.feed.id)
+        with patch("rssfeed.tasks.parse_feed") as parse_feed_mock:
+            with self.assertNumQueries(2):
+                poll_feed(self.feed.id)
+        self.assertFalse(parse_feed_mock.called)
+        self.assertEqual(
+            Feed.objects.get(pk=self.feed.id).last_polled, feed.last_polled
+        )
+
+    def test_same_entries(self):
+        poll_feed(self.feed.id)
+        feed = Feed.objects.get(pk=self.feed.id)
+        result = FetchResult(
+            feed.url, status=200,
+            body=TEST_RSS.replace("Thu, 26 Jan 2017 14:29:59 GMT",
+                                  "Thu, 26 Jan 2017 15:29:59 GMT")
+        )
+        with patch("rssfeed.tasks.parse_entries") as parse_entries_mock:
+            update_feed(feed, result, parse_result(result))
+        self.assertFalse(parse_entries_mock.called)
+        self.assertEqual(
+            Feed.objects.get(pk=self.feed.id).body_digest, result.digest
+        )
+
+    def test_newest_entry(self):
+        poll_feed(self.feed.id)
+        feed = Feed.objects.get(pk=self.feed.id)
+        self.assertEqual(
+            feed.newest_entry_hash,
+            make_link_hash("http://www.bbc.co.uk/news/uk-38756409")
+        )
+        # A new entry on top, parsing stops at the newest entry stored
+        result = FetchResult(
+            feed.url, status=200,
+            body=TEST_RSS.replace("<item>", """<item>
+            <title>New entry</title>
+            <link>http://www.bbc.co.uk/news/new</link>
+            <pubDate>Thu, 26 Jan 2017 14:00:00 GMT</pubDate>
+            </item><item>""", 1)
+        )
+        with patch(
+                "rssfeed.tasks.get_entry_attrs",
+                wraps=tasks.get_entry_attrs) as get_entry_attrs:
+            parsed = parse_result(result, False, feed.newest_entry_hash)
+        self.assertEqual(get_entry_attrs.call_count, 1)
+        update_feed(feed, result, parsed)
+        self.assertEqual(Entry.objects.filter(feed=feed).count(), 3)
+        self.assertEqual(
+            Feed.objects.get(pk=self.feed.id).newest_entry_hash,
+            make_link_hash("http://www.bbc.co.uk/news/new")
+        )
+
+    def test_only_changed_columns_written(self):
+        poll_feed(self.feed.id)
+        feed = Feed.objects.get(pk=self.feed.id)
+        result = FetchResult(
+            feed.url, status=200,
+            body=TEST_RSS.replace("BBC News - Home]]></title>",
+                                  "BBC News - Front]]></title>")
+        )
+        with CaptureQueriesContext(connection) as queries:
+            update_feed(feed, result, parse_result(result))
+        updates = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.assertNotIn('"image"', updates[0])
+        self.assertEqual(
+            Feed.objects.get(pk=self.feed.id).title, "BBC News - Front"
+        )
+
+    def tearDown(self):
+        self.patcher.stop()
+
+
 class PollFeedBozoExceptionTest(TestCase):
     """
     Test polling feeds where Bozo Exception returned.
@@ -125,13 +255,22 @@ class PollFeedBozoExceptionTest(TestCase):
         )
 
     def test_bozo_exception(self):
-        # Test with Bozo Exception returned
+        # Test with Bozo Exception returned and no entries, a failed poll
         parser_mock = self.parser_mock
         parser_mock.return_value.feed.bozo_exception = \
             "bozo_exception returned"
+        # The mock is shared by the other tests
+        self.addCleanup(
+            parser_mock.return_value.feed.__dict__.pop, "bozo_exception"
+        )
         with patch("rssfeed.tasks.feedparser.parse", parser_mock):
             with patch("rssfeed.tasks.poll_feed.pk_feed", self.feed.id):
-                poll_feed(self.feed.id, verbose=True)
+                self.assertRaises(
+                    MalformedFeedError, poll_feed, self.feed.id, verbose=True
+                )
+        feed = Feed.objects.get(pk=self.feed.id)
+        self.assertEqual(feed.consecutive_failures, 1)
+        self.assertIn("bozo_exception returned", feed.last_error)
 
 
 class PollEntriesTest(TestCase):
@@ -140,8 +279,8 @@ class PollEntriesTest(TestCase):
         super(PollEntriesTest, cls).setUpClass()
         # Create feedparser.parse_mock object
         cls.parser_mock = MagicMock()
-        cls.beautifulsoup_mock = MagicMock()
-        cls.beautifulsoup_mock.return_value.text = "This is a description"
+        cls.strip_html_mock = MagicMock()
+        cls.strip_html_mock.return_value = "This is a description"
         del cls.parser_mock.return_value.feed.bozo_exception
         cls.parser_mock.return_value.feed.published_parsed = (
             2017, 1, 1,
@@ -198,7 +337,7 @@ class PollEntriesTest(TestCase):
         entry_mock.title = ""
         parser_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parser_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -206,15 +345,14 @@ class PollEntriesTest(TestCase):
     def test_feed_entry_max(self):
         # Test with missing attribute: description_detail
         parser_mock = self.parser_mock
-        beautifulsoup_mock = self.beautifulsoup_mock
+        strip_html_mock = self.strip_html_mock
         entry_mock = Mock(**self.entry_attrs)
         parser_mock.return_value.entries = []
         parser_mock.return_value.entries = [entry_mock, entry_mock, entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parser_mock):
-            with patch("rssfeed.tasks.BeautifulSoup.BeautifulSoup",
-                       beautifulsoup_mock):
+            with patch("rssfeed.tasks.strip_html", strip_html_mock):
                 with patch("rssfeed.tasks.Entry", db_entry_mock):
                     poll_feed(self.feed.id, verbose=True)
 
@@ -226,7 +364,7 @@ class PollEntriesTest(TestCase):
         del entry_mock.description_detail
         parser_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parser_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -239,7 +377,7 @@ class PollEntriesTest(TestCase):
         entry_mock.description = "Test Feed Description"
         parse_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parse_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -252,7 +390,7 @@ class PollEntriesTest(TestCase):
         entry_mock.description = "Test Feed Description"
         parse_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parse_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -269,7 +407,7 @@ class PollEntriesTest(TestCase):
         entry_mock.description = "Test Feed Description"
         parse_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parse_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -284,7 +422,7 @@ class PollEntriesTest(TestCase):
         entry_mock.description = "Test Feed Description"
         parse_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parse_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -299,7 +437,7 @@ class PollEntriesTest(TestCase):
         entry_mock.description = "Test Feed Description"
         parse_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parse_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
@@ -315,7 +453,136 @@ class PollEntriesTest(TestCase):
         entry_mock.description = "Test Feed Description"
         parse_mock.return_value.entries = [entry_mock]
         db_entry_mock = Mock()
-        db_entry_mock.objects.get_or_create.return_value = (Mock(), True)
+        db_entry_mock.objects.filter.return_value.values_list.return_value = []
         with patch("rssfeed.tasks.feedparser.parse", parse_mock):
             with patch("rssfeed.tasks.Entry", db_entry_mock):
                 poll_feed(self.feed.id, verbose=True)
+
+
+class BulkParseEntriesTest(TestCase):
+    """
+    Test that entries are ingested with a constant number of queries.
+    """
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feed = Feed.objects.create(
+            url="http://localhost:%s/test/feed" % PORT
+        )
+        self.entries = parse_feed(TEST_RSS)["entries"]
+
+    def test_query_count(self):
+        # One lookup and one insert, inside a savepoint
+        with self.assertNumQueries(4):
+            created = parse_entries(self.entries, self.feed, False)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(Entry.objects.filter(feed=self.feed).count(), 2)
+
+    def test_existing_entries_skipped(self):
+        parse_entries(self.entries, self.feed, False)
+        with self.assertNumQueries(1):
+            created = parse_entries(self.entries, self.feed, False)
+        self.assertEqual(created, [])
+
+    def test_published_kept(self):
+        parse_entries(self.entries, self.feed, False)
+        entry = Entry.objects.get(
+            link="http://www.bbc.co.uk/news/uk-38756409"
+        )
+        self.assertEqual(entry.published.year, 2017)
+
+    def test_concurrent_insert(self):
+        # Another poll stored one of the entries after our lookup
+        Entry.objects.create(
+            feed=self.feed, link="http://www.bbc.co.uk/news/uk-38756409"
+        )
+        new_entries = [
+            Entry(feed=self.feed, link=link, link_hash=make_link_hash(link))
+            for link in [
+                "http://www.bbc.co.uk/news/uk-38756409",
+                "http://www.bbc.co.uk/news/business-38755242"
+            ]
+        ]
+        created = create_entries(new_entries)
+        self.assertEqual(
+            [entry.link for entry in created],
+            ["http://www.bbc.co.uk/news/business-38755242"]
+        )
+        self.assertEqual(Entry.objects.filter(feed=self.feed).count(), 2)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+
+class ParseStageTest(TestCase):
+    """
+    Test parsing fetched feeds separately from storing them.
+    """
+
+    def setUp(self):
+        self.results = [
+            FetchResult("http://example.com/feed", status=200, body=TEST_RSS),
+            FetchResult("http://example.com/gone", status=304),
+        ]
+
+    def test_parse_feed(self):
+        parsed = parse_feed(TEST_RSS)
+        self.assertEqual(parsed["feed"]["title"], "BBC News - Home")
+        self.assertEqual(parsed["hint"], 15 * 60)
+        self.assertEqual(len(parsed["entries"]), 3)
+        self.assertEqual(
+            parsed["entries"][0]["link"],
+            "http://www.bbc.co.uk/news/uk-38756409"
+        )
+        # The result is compact enough to hand between processes
+        self.assertEqual(pickle.loads(pickle.dumps(parsed)), parsed)
+
+    def test_newest_entry_hash(self):
+        newest_entry_hash = make_link_hash(
+            "http://www.bbc.co.uk/news/business-38755242"
+        )
+        parsed = parse_feed(TEST_RSS, newest_entry_hash=newest_entry_hash)
+        self.assertEqual(len(parsed["entries"]), 1)
+        # Entries that were not parsed still count in the digest
+        self.assertEqual(
+            parsed["entries_digest"], parse_feed(TEST_RSS)["entries_digest"]
+        )
+        # Entries out of order are all parsed, a new one may come later
+        parsed = parse_feed(
+            TEST_RSS.replace("Thu, 26 Jan 2017 13:51:01 GMT",
+                             "Wed, 25 Jan 2017 13:51:01 GMT"),
+            newest_entry_hash=newest_entry_hash
+        )
+        self.assertEqual(len(parsed["entries"]), 3)
+
+    def test_entry_without_link(self):
+        body = TEST_RSS.replace(
+            "<link>http://www.bbc.co.uk/news/uk-38756409</link>", "", 1
+        ).replace(
+            '<guid isPermaLink="true">http://www.bbc.co.uk/news/uk-38756409',
+            '<guid isPermaLink="false">uk-38756409', 1
+        )
+        self.assertNotEqual(body, TEST_RSS)
+        parsed = parse_feed(body, verbose=True)
+        # Only the entry without a link is skipped, the poll does not fail
+        self.assertEqual(len(parsed["entries"]), 2)
+        self.assertNotIn(
+            "http://www.bbc.co.uk/news/uk-38756409",
+            [entry["link"] for entry in parsed["entries"]]
+        )
+
+    @override_settings(RSSFEED_PARSE_PROCESSES=2)
+    def test_parse_many_in_processes(self):
+        try:
+            parsed = parse_many(self.results)
+        finally:
+            tasks.get_parse_pool().terminate()
+            tasks._parse_pool = None
+        self.assertEqual(parsed[0], parse_feed(TEST_RSS))
+        self.assertIsNone(parsed[1])
+
+    def test_parse_error_returned(self):
+        with patch("rssfeed.tasks.feedparser.parse", side_effect=ValueError):
+            parsed = parse_many(self.results)
+        self.assertTrue(isinstance(parsed[0], ValueError))
@@ -1,10 +1,19 @@
+from datetime import timedelta
 from unittest import TestCase
 
+from django.core.cache import cache
 from django.template import Context
 from django.template import Template
+from django.template.loader import render_to_string
+from django.test import TestCase as DjangoTestCase
+from django.test import override_settings
+from django.utils import timezone, translation
+from django.utils.timesince import timesince
 from mock import patch
 
-from rssfeed.models import Entry, Feed
+from rssfeed.models import Entry, Feed, make_link_hash
+from rssfeed.tasks import parse_entries
+from rssfeed.templatetags.rssfeed_tags import get_fragment_key
 from rssfeed.tests.simple_test_server import server_setup, server_teardown, \
     PORT
 
@@ -45,3 +54,168 @@ class RssFeedTagTest(TestCase):
 
     def tearDown(self):
         self.patcher.stop()
+
+
+class CachedRssFeedTagTest(DjangoTestCase):
+    TEMPLATE = Template(
+        "{% load rssfeed_tags %} {% render_rssfeed_cached 2 %}"
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feed = Feed.objects.create(
+            url="http://localhost:%s/test/cached" % PORT
+        )
+        self.entry = Entry.objects.create(
+            feed=self.feed,
+            title="Cached Entry",
+            link="http://example.com/cached"
+        )
+
+    def test_cached(self):
+        rendered = self.TEMPLATE.render(Context({}))
+        self.assertIn(self.entry.title, rendered)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.TEMPLATE.render(Context({})), rendered)
+
+    def test_invalidated_by_new_entries(self):
+        self.TEMPLATE.render(Context({}))
+        parse_entries(
+            [{"link": "http://example.com/new",
+              "link_hash": make_link_hash("http://example.com/new"),
+              "title": "New Entry"}],
+            self.feed,
+            False
+        )
+        self.assertIn("New Entry", self.TEMPLATE.render(Context({})))
+
+    def test_same_markup(self):
+        Entry.objects.filter(pk=self.entry.pk).update(
+            title="Cached [[rssfeed:ago:5]]",
+            published=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(
+            self.TEMPLATE.render(Context({})),
+            Template(
+                "{% load rssfeed_tags %} {% render_rssfeed 2 %}"
+            ).render(Context({}))
+        )
+
+    def test_ago_current(self):
+        published = timezone.now() - timedelta(hours=1)
+        Entry.objects.filter(pk=self.entry.pk).update(published=published)
+        self.TEMPLATE.render(Context({}))
+        # Only the time since the entry was published is not cached
+        with patch(
+                "rssfeed.templatetags.rssfeed_tags.timesince",
+                lambda d: timesince(d, published + timedelta(days=2))):
+            self.assertIn(
+                u"2\xa0days ago", self.TEMPLATE.render(Context({}))
+            )
+
+    def test_language_and_timezone(self):
+        self.TEMPLATE.render(Context({}))
+        for override in [
+                translation.override("de"), timezone.override("Asia/Tokyo")]:
+            with override, patch(
+                    "rssfeed.templatetags.rssfeed_tags.render_to_string",
+                    wraps=render_to_string) as render_mock:
+                self.TEMPLATE.render(Context({}))
+            self.assertTrue(render_mock.called)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+
+class FragmentsRssFeedTagTest(DjangoTestCase):
+    TEMPLATE = Template(
+        "{% load rssfeed_tags %} {% render_rssfeed_fragments 3 %}"
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.mock_delay = self.patcher.start()
+        self.feed = Feed.objects.create(
+            url="http://localhost:%s/test/fragments" % PORT, title="Feed"
+        )
+        self.entries = [
+            Entry.objects.create(
+                feed=self.feed,
+                title="Entry %s" % i,
+                link="http://example.com/fragments/%s" % i,
+                published=timezone.now() - timedelta(hours=i + 1)
+            )
+            for i in range(2)
+        ]
+
+    def render(self):
+        return self.TEMPLATE.render(Context({}))
+
+    def test_same_markup(self):
+        self.assertEqual(
+            self.render(),
+            Template(
+                "{% load rssfeed_tags %} {% render_rssfeed 3 %}"
+            ).render(Context({}))
+        )
+        self.assertIn(u"1\xa0hour ago", self.render())
+
+    def test_only_new_entries_rendered(self):
+        self.render()
+        Entry.objects.create(
+            feed=self.feed, title="New Entry", link="http://example.com/new"
+        )
+        with patch(
+                "rssfeed.templatetags.rssfeed_tags.render_to_string",
+                wraps=render_to_string) as render_mock:
+            rendered = self.render()
+        self.assertIn("New Entry", rendered)
+        # The new entry and the list
+        self.assertEqual(render_mock.call_count, 2)
+
+    def test_ago_current(self):
+        self.render()
+        Entry.objects.filter(pk=self.entries[0].pk).update(
+            published=timezone.now() - timedelta(days=2)
+        )
+        self.assertIn(u"2\xa0days ago", self.render())
+
+    def test_thumbnail(self):
+        self.render()
+        Entry.objects.filter(pk=self.entries[0].pk).update(
+            thumbnail="/media/thumbnail.jpg"
+        )
+        self.assertIn('<img src="/media/thumbnail.jpg"/>', self.render())
+
+    def test_feed_changed(self):
+        self.render()
+        Feed.objects.filter(pk=self.feed.pk).update(title="Renamed")
+        self.assertIn("Renamed", self.render())
+        Feed.objects.filter(pk=self.feed.pk).update(
+            link="http://example.com/moved"
+        )
+        self.assertIn('href="http://example.com/moved"', self.render())
+
+    def test_render_version(self):
+        rendered = self.render()
+        with patch(
+                "rssfeed.templatetags.rssfeed_tags.render_to_string",
+                wraps=render_to_string) as render_mock:
+            self.assertEqual(self.render(), rendered)
+            self.assertEqual(render_mock.call_count, 1)
+            with override_settings(RSSFEED_RENDER_VERSION=2):
+                self.assertEqual(self.render(), rendered)
+        # Both entries and the list
+        self.assertEqual(render_mock.call_count, 4)
+
+    def test_language(self):
+        with translation.override("de"):
+            key = get_fragment_key(self.entries[0])
+        with translation.override("en"):
+            self.assertNotEqual(get_fragment_key(self.entries[0]), key)
+
+    def tearDown(self):
+        self.patcher.stop()
@@ -0,0 +1,71 @@
+from django.test import TestCase
+from django.test import override_settings
+
+from rssfeed.text import (
+    beautifulsoup_to_text, html_to_text, strip_html, truncate
+)
+
+
+class HtmlToTextTest(TestCase):
+
+    def test_text(self):
+        self.assertEqual(
+            html_to_text("<p>One <b>bold</b> word.</p><p>Two</p>"),
+            "One bold word. Two"
+        )
+        self.assertEqual(html_to_text("Line<br>break<br/>s"), "Line break s")
+        self.assertEqual(html_to_text("<li>a</li><li>b</li>"), "a b")
+        self.assertEqual(html_to_text("  spread \n\t out  "), "spread out")
+        self.assertEqual(html_to_text(""), "")
+
+    def test_skipped_tags(self):
+        self.assertEqual(
+            html_to_text(
+                "<style>p {}</style>Text<script>var a = '<p>';</script>"
+            ),
+            "Text"
+        )
+
+    def test_references(self):
+        # References are kept, descriptions are rendered as safe
+        self.assertEqual(
+            html_to_text("AT&amp;T &#8220;quoted&#x201d; &lt;b&gt;"),
+            "AT&amp;T &#8220;quoted&#x201d; &lt;b&gt;"
+        )
+        self.assertEqual(html_to_text("1 < 2"), "1 &lt; 2")
+
+    def test_malformed(self):
+        self.assertEqual(html_to_text("<p>Unclosed <b>tags"), "Unclosed tags")
+        self.assertEqual(
+            html_to_text("Broken <a href='x"), "Broken &lt;a href='x"
+        )
+
+    def test_max_length(self):
+        html = "<p>%s</p>" % ("word " * 10000)
+        text = html_to_text(html, 22)
+        self.assertEqual(text, "word word word word")
+        self.assertEqual(html_to_text("<p>word</p>", 4), "word")
+        self.assertEqual(len(html_to_text(html, 5000)), 4999)
+
+    def test_truncate(self):
+        self.assertEqual(truncate("one two", None), "one two")
+        self.assertEqual(truncate("one two", 3), "one")
+        self.assertEqual(truncate("one two", 5), "one")
+        self.assertEqual(truncate("onetwo", 4), "onet")
+        self.assertEqual(truncate("AT&amp;T", 5), "AT")
+
+    def test_beautifulsoup(self):
+        self.assertEqual(
+            beautifulsoup_to_text("<p>One <b>bold</b></p><p>Two</p>"),
+            "OneboldTwo"
+        )
+
+    def test_backend_setting(self):
+        html = "<p>One</p><p>Two</p>"
+        self.assertEqual(strip_html(html), "One Two")
+        with override_settings(
+            RSSFEED_TEXT_BACKEND="rssfeed.text.beautifulsoup_to_text",
+            RSSFEED_DESCRIPTION_MAX_LENGTH=4
+        ):
+            self.assertEqual(strip_html(html), "OneT")
+        self.assertEqual(strip_html(html), "One Two")
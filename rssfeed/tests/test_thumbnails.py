@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.template import Context, Template
+from django.test import TestCase
+from django.test import override_settings
+from mock import patch
+from photologue.models import Photo, PhotoSize
+from PIL import Image
+
+from rssfeed.fetch import FetchResult
+from rssfeed.models import Entry, Feed
+from rssfeed.tasks import make_thumbnails, queue_thumbnails
+
+
+def make_image(color, size=(976, 549)):
+    data = BytesIO()
+    Image.new("RGB", size, color).save(data, "JPEG")
+    return data.getvalue()
+
+
+IMAGES = {
+    "http://example.com/red.jpg": make_image("red"),
+    "http://example.com/copy.jpg": make_image("red"),
+    "http://example.com/blue.jpg": make_image("blue"),
+    "http://example.com/text.jpg": b"Not an image",
+}
+
+
+def fetch_many(requests, max_items=None):
+    return [
+        FetchResult(url, status=200, body=IMAGES[url])
+        if url in IMAGES else FetchResult(url, status=404, error="HTTP 404")
+        for url, etag, modified in requests
+    ]
+
+
+@override_settings(RSSFEED_THUMBNAIL_SIZE="rssfeed_thumbnail")
+class ThumbnailTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.patcher.start()
+        self.fetcher = patch(
+            "rssfeed.thumbnails.get_fetcher"
+        ).start().return_value
+        self.fetcher.fetch_many.side_effect = fetch_many
+        self.feed = Feed.objects.create(url="http://example.com/feed")
+        for i, image in enumerate(sorted(IMAGES) + [
+                "http://example.com/missing.jpg", ""]):
+            Entry.objects.create(
+                feed=self.feed, title="Entry %s" % i, image=image,
+                link="http://example.com/entries/%s" % i
+            )
+
+    def tearDown(self):
+        patch.stopall()
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def make_thumbnails(self):
+        make_thumbnails(self.feed.pk, list(
+            Entry.objects.values_list("link_hash", flat=True)
+        ))
+        return dict(Entry.objects.values_list("image", "thumbnail"))
+
+    def test_thumbnails(self):
+        thumbnails = self.make_thumbnails()
+        # Images with the same content share a photo
+        self.assertEqual(Photo.objects.count(), 2)
+        self.assertEqual(
+            thumbnails["http://example.com/red.jpg"],
+            thumbnails["http://example.com/copy.jpg"]
+        )
+        self.assertNotEqual(
+            thumbnails["http://example.com/red.jpg"],
+            thumbnails["http://example.com/blue.jpg"]
+        )
+        self.assertIn("rssfeed_thumbnail", thumbnails[
+            "http://example.com/blue.jpg"
+        ])
+        photo = Photo.objects.all()[0]
+        self.assertEqual(photo.get_rssfeed_thumbnail_size(), (320, 180))
+        # Failures are not tried again, entries without an image are skipped
+        self.assertEqual(thumbnails["http://example.com/text.jpg"], "")
+        self.assertEqual(thumbnails["http://example.com/missing.jpg"], "")
+        self.assertIsNone(thumbnails[""])
+
+    def test_made_once(self):
+        self.make_thumbnails()
+        self.fetcher.fetch_many.reset_mock()
+        self.make_thumbnails()
+        self.assertFalse(self.fetcher.fetch_many.called)
+
+    def test_photo_size(self):
+        PhotoSize.objects.create(name="rssfeed_thumbnail", width=100)
+        self.make_thumbnails()
+        self.assertEqual(
+            Photo.objects.all()[0].get_rssfeed_thumbnail_size(), (100, 56)
+        )
+
+    def test_queued(self):
+        created = list(Entry.objects.all())
+        with patch("rssfeed.tasks.make_thumbnails.delay") as delay:
+            queue_thumbnails(self.feed, created)
+        self.assertEqual(len(delay.call_args[0][1]), 5)
+        with override_settings(RSSFEED_THUMBNAIL_SIZE=None):
+            with patch("rssfeed.tasks.make_thumbnails.delay") as delay:
+                queue_thumbnails(self.feed, created)
+        self.assertFalse(delay.called)
+
+    def test_template(self):
+        self.make_thumbnails()
+        rendered = Template(
+            "{% load rssfeed_tags %}{% render_rssfeed 10 %}"
+        ).render(Context())
+        entry = Entry.objects.get(image="http://example.com/blue.jpg")
+        self.assertIn('<img src="%s"/>' % entry.thumbnail, rendered)
+        self.assertNotIn('<img src="http://example.com/blue.jpg"/>', rendered)
+        # Entries without a thumbnail keep their image
+        self.assertIn('<img src="http://example.com/missing.jpg"/>', rendered)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+from mock import patch
+
+from rssfeed.models import Entry, Feed
+
+
+class EntryListTest(TestCase):
+    url = reverse("rssfeed_entry_list")
+
+    def setUp(self):
+        self.patcher = patch("rssfeed.tasks.poll_feed.delay")
+        self.patcher.start()
+        self.feeds = [
+            Feed.objects.create(url="http://example.com/%s" % i)
+            for i in range(2)
+        ]
+        now = timezone.now()
+        # Pairs of entries share a published time, so pages can only be
+        # told apart by id
+        self.entries = [
+            Entry.objects.create(
+                feed=self.feeds[i % 2],
+                title="Entry %s" % i,
+                link="http://example.com/entries/%s" % i,
+                published=now - timedelta(minutes=i // 2)
+            )
+            for i in range(7)
+        ]
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def get_all(self, params):
+        ids = []
+        url = self.url
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(entry["id"] for entry in data["entries"])
+            url, params = data["next"], {}
+        return ids
+
+    def test_first_page(self):
+        response = self.client.get(self.url, {"limit": 2})
+        data = response.json()
+        entry = self.entries[1]
+        self.assertEqual(data["entries"][0], {
+            "id": entry.pk,
+            "feed": self.feeds[1].pk,
+            "title": "Entry 1",
+            "link": "http://example.com/entries/1",
+            "description": None,
+            "image": None,
+            "published": entry.published.isoformat(),
+        })
+        self.assertEqual(data["entries"][1]["id"], self.entries[0].pk)
+        self.assertIn("cursor=", data["next"])
+        self.assertIn("limit=2", data["next"])
+
+    def test_pages(self):
+        expected = [
+            entry.pk for entry in sorted(
+                self.entries, key=lambda e: (e.published, e.pk), reverse=True
+            )
+        ]
+        self.assertEqual(self.get_all({"limit": 2}), expected)
+        self.assertEqual(self.get_all({"limit": 7}), expected)
+
+    def test_feed_filter(self):
+        ids = self.get_all({"limit": 1, "feed": self.feeds[0].pk})
+        self.assertEqual(
+            ids, [entry.pk for entry in self.entries[::2]]
+        )
+
+    def test_page_queries(self):
+        response = self.client.get(self.url, {"limit": 2})
+        with self.assertNumQueries(1):
+            self.client.get(response.json()["next"])
+
+    @override_settings(RSSFEED_API_MAX_PAGE_SIZE=3)
+    def test_max_page_size(self):
+        response = self.client.get(self.url, {"limit": 1000})
+        self.assertEqual(len(response.json()["entries"]), 3)
+
+    def test_invalid(self):
+        for params in [{"cursor": "nope"}, {"limit": "x"}, {"feed": "x"}]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 405)
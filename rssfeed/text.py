@@ -0,0 +1,139 @@
+"""
+Conversion of entry descriptions from HTML to text.
+
+Descriptions are converted by the function named by the
+RSSFEED_TEXT_BACKEND setting, called with the HTML and the maximum length of
+the text. The text keeps the entity and character references of the HTML,
+since templates render descriptions as safe.
+"""
+import re
+from HTMLParser import HTMLParseError, HTMLParser
+
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from rssfeed.conf import get_setting
+
+# Characters of HTML fed to the parser at a time, so parsing can stop once
+# the text is long enough
+CHUNK_SIZE = 4 * 1024
+# Tags separating words in the text
+BLOCK_TAGS = frozenset([
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl",
+    "dt", "figcaption", "figure", "footer", "h1", "h2", "h3", "h4", "h5",
+    "h6", "header", "hr", "img", "li", "ol", "p", "pre", "section", "table",
+    "td", "th", "tr", "ul",
+])
+# Tags whose content is not text
+SKIP_TAGS = frozenset(["script", "style"])
+PARTIAL_REFERENCE = re.compile(r"&#?\w*$")
+
+
+class TextParser(HTMLParser):
+    """
+    Collects the text of the HTML fed to it without building a tree.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.parts = []
+        self.length = 0
+        self.skip = 0
+
+    def append(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip += 1
+        elif tag in BLOCK_TAGS:
+            self.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip = max(self.skip - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.append(" ")
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.append(data.replace("<", "&lt;").replace(">", "&gt;"))
+
+    def handle_entityref(self, name):
+        if not self.skip:
+            self.append("&%s;" % name)
+
+    def handle_charref(self, name):
+        if not self.skip:
+            self.append("&#%s;" % name)
+
+    def get_text(self):
+        return " ".join("".join(self.parts).split())
+
+
+def truncate(text, max_length):
+    """
+    Cut the text to at most max_length characters, at a word boundary when
+    there is one and never inside an entity reference.
+    """
+    if not max_length or len(text) <= max_length:
+        return text
+    if text[max_length] == " ":
+        return text[:max_length]
+    text = text[:max_length]
+    if " " in text:
+        return text.rsplit(" ", 1)[0]
+    return PARTIAL_REFERENCE.sub("", text)
+
+
+def html_to_text(html, max_length=None):
+    """
+    Return the text of the HTML, with tags separating blocks of text
+    replaced by spaces and runs of whitespace collapsed.
+    """
+    parser = TextParser()
+    try:
+        for start in range(0, len(html), CHUNK_SIZE):
+            parser.feed(html[start:start + CHUNK_SIZE])
+            if max_length and parser.length > max_length and len(
+                    parser.get_text()) > max_length:
+                break
+        else:
+            parser.close()
+    except HTMLParseError:
+        pass
+    return truncate(parser.get_text(), max_length)
+
+
+def beautifulsoup_to_text(html, max_length=None):
+    """
+    Return the text of the HTML as BeautifulSoup 3 finds it. Text in
+    separate tags is joined without spaces.
+    """
+    import BeautifulSoup
+
+    return truncate(BeautifulSoup.BeautifulSoup(html).text, max_length)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(get_setting("TEXT_BACKEND"))
+    return _backend
+
+
+def reset_backend(**kwargs):
+    global _backend
+    if kwargs.get("setting") == "RSSFEED_TEXT_BACKEND":
+        _backend = None
+
+
+setting_changed.connect(reset_backend)
+
+
+def strip_html(html):
+    return get_backend()(html, get_setting("DESCRIPTION_MAX_LENGTH"))
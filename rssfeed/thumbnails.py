@@ -0,0 +1,116 @@
+"""
+Local thumbnails of entry images, so pages do not hotlink full size images
+from publishers. Images are downloaded once, stored as photologue photos
+named after a hash of their content and resized with a photologue
+PhotoSize. Requires "photologue", "sortedm2m" and "django.contrib.sites" in
+INSTALLED_APPS.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from PIL import Image
+from photologue.models import Photo, PhotoSize
+
+from rssfeed.conf import get_setting
+from rssfeed.fetch import get_fetcher
+from rssfeed.models import Entry
+
+IMAGE_EXTENSIONS = {
+    "GIF": ".gif",
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "WEBP": ".webp",
+}
+
+
+def get_photo_size():
+    """
+    Return the RSSFEED_THUMBNAIL_SIZE PhotoSize, created with
+    RSSFEED_THUMBNAIL_WIDTH and RSSFEED_THUMBNAIL_HEIGHT if missing.
+    """
+    photo_size, created = PhotoSize.objects.get_or_create(
+        name=get_setting("THUMBNAIL_SIZE"),
+        defaults={
+            "width": get_setting("THUMBNAIL_WIDTH"),
+            "height": get_setting("THUMBNAIL_HEIGHT"),
+            "crop": True,
+        }
+    )
+    return photo_size
+
+
+def get_image_extension(data):
+    """
+    Return the file extension of an image, or None if it is not an image.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.verify()
+    except Exception:
+        return None
+    return IMAGE_EXTENSIONS.get(image.format)
+
+
+def get_photo(data):
+    """
+    Return the photo of an image, stored once for the same content.
+    """
+    digest = hashlib.sha1(data).hexdigest()
+    slug = "rssfeed-%s" % digest
+    photo = Photo.objects.filter(slug=slug).first()
+    if photo is not None:
+        return photo
+    extension = get_image_extension(data)
+    if extension is None:
+        raise ValueError("Not an image")
+    photo = Photo(title=slug, slug=slug, is_public=False)
+    try:
+        with transaction.atomic():
+            photo.image.save(digest + extension, ContentFile(data))
+    except IntegrityError:
+        # Stored by a concurrent task
+        photo.image.delete(save=False)
+        return Photo.objects.get(slug=slug)
+    return photo
+
+
+def make_thumbnail(data, photo_size):
+    """
+    Return the url of the thumbnail of an image.
+    """
+    photo = get_photo(data)
+    return getattr(photo, "get_%s_url" % photo_size.name)()
+
+
+def make_thumbnails(entries, verbose=False):
+    """
+    Download the images of entries and store the urls of their thumbnails,
+    or an empty string for those that could not be made. Returns the
+    number of thumbnails made.
+    """
+    if not entries:
+        return 0
+    photo_size = get_photo_size()
+    urls = sorted(set(entry.image.name for entry in entries))
+    results = get_fetcher().fetch_many([(url, None, None) for url in urls])
+    made = 0
+    for url, result in zip(urls, results):
+        thumbnail = ""
+        if result.error or result.truncated or not result.body:
+            if verbose:
+                print('rssfeed make_thumbnails. Image "%s" failed: %s' % (
+                    url, result.error or "truncated"))
+        else:
+            try:
+                thumbnail = make_thumbnail(result.body, photo_size)
+                made += 1
+            except (IOError, ValueError) as e:
+                if verbose:
+                    print('rssfeed make_thumbnails. Image "%s" failed: %s' % (
+                        url, e))
+        Entry.objects.filter(
+            pk__in=[entry.pk for entry in entries if entry.image.name == url]
+        ).update(thumbnail=thumbnail)
+    return made
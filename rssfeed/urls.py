@@ -0,0 +1,18 @@
+from django.conf.urls import url
+
+from rssfeed import feeds, views
+
+
+urlpatterns = [
+    url(r"^entries/$", views.entry_list, name="rssfeed_entry_list"),
+    url(r"^rss/$", feeds.entries_rss, name="rssfeed_entries_rss"),
+    url(r"^atom/$", feeds.entries_atom, name="rssfeed_entries_atom"),
+    url(
+        r"^feeds/(?P<feed_id>\d+)/rss/$", feeds.entries_rss,
+        name="rssfeed_feed_entries_rss"
+    ),
+    url(
+        r"^feeds/(?P<feed_id>\d+)/atom/$", feeds.entries_atom,
+        name="rssfeed_feed_entries_atom"
+    ),
+]
@@ -0,0 +1,118 @@
+import base64
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+
+from rssfeed.conf import get_setting
+from rssfeed.models import Entry
+from rssfeed.search import search_entries
+
+ENTRY_FIELDS = [
+    "id", "feed_id", "title", "link", "description", "image", "published"
+]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry):
+    """
+    Return the opaque cursor of the page after the entry, from the values
+    it is ordered by.
+    """
+    value = "%s|%s" % (entry["published"].isoformat(), entry["id"])
+    return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Return the published date and id encoded in a cursor.
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        published, pk = value.decode("utf-8").split("|")
+        published = parse_datetime(published)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor("Invalid cursor")
+    if published is None:
+        raise InvalidCursor("Invalid cursor")
+    return published, pk
+
+
+def get_entries_page(cursor=None, feeds=None, limit=None, query=None):
+    """
+    Return up to limit entries, newest first, and the cursor of the next
+    page or None. A query limits them to the entries matching it.
+
+    Pages are found by seeking past the (published, id) pair of the last
+    entry instead of by an offset, so every page costs the same however far
+    in it is. The redundant published__lte bound lets the database start
+    the scan of the (published, id) index at the cursor.
+    """
+    entries = Entry.objects.order_by("-published", "-id")
+    if feeds:
+        entries = entries.filter(feed_id__in=feeds)
+    if query:
+        entries = search_entries(entries, query)
+    if cursor is not None:
+        published, pk = decode_cursor(cursor)
+        entries = entries.filter(published__lte=published).filter(
+            Q(published__lt=published) | Q(id__lt=pk)
+        )
+    page = list(entries.values(*ENTRY_FIELDS)[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1])
+    return page, next_cursor
+
+
+def serialize_entry(entry):
+    return {
+        "id": entry["id"],
+        "feed": entry["feed_id"],
+        "title": entry["title"],
+        "link": entry["link"],
+        "description": entry["description"],
+        "image": entry["image"] or None,
+        "published": entry["published"].isoformat(),
+    }
+
+
+@require_GET
+def entry_list(request):
+    """
+    Entries as JSON, newest first. Takes an optional ``cursor`` from the
+    ``next`` url of the previous page, ``feed`` ids to filter by, a search
+    query ``q`` and a ``limit``.
+    """
+    try:
+        feeds = [int(pk) for pk in request.GET.getlist("feed")]
+        limit = int(request.GET.get("limit", get_setting("API_PAGE_SIZE")))
+    except ValueError:
+        return JsonResponse(
+            {"error": "feed and limit must be integers"}, status=400
+        )
+    limit = max(1, min(limit, get_setting("API_MAX_PAGE_SIZE")))
+    try:
+        page, next_cursor = get_entries_page(
+            request.GET.get("cursor"), feeds, limit, request.GET.get("q")
+        )
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    next_url = None
+    if next_cursor is not None:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_url = request.build_absolute_uri(
+            "%s?%s" % (request.path, params.urlencode())
+        )
+    return JsonResponse({
+        "entries": [serialize_entry(entry) for entry in page],
+        "next": next_url,
+    })